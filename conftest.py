@@ -0,0 +1,2 @@
+# The stingar_* modules sit at the top of the repository; this file puts it
+# on sys.path so the tests under tests/ import them like the dashboard does.
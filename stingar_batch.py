@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from stingar_data import (HISTOGRAM_COLUMNS, SCHEMA_VERSION, aggregate_data, build_event_index, filter_events,
+                          list_event_files, parse_window)
+from stingar_store import read_event_store, store_paths, sync_event_store
+
+# Batch precompute of the per-IP profiles for the default dashboard filters.
+# Events are sharded by a hash of src_ip, so every IP is aggregated whole in
+# one worker process and the merged table equals a single aggregate_data call.
+
+PROFILE_METADATA_KEY = b'stingar_profiles'
+
+def shard_codes(src_ips, n_shards):
+    """Shard of each IP, stable across processes and runs unlike hash()."""
+    return pd.util.hash_array(np.asarray(src_ips, dtype=object)) % np.uint64(n_shards)
+
+def default_filter(df):
+    """Events the dashboard keeps with its default filters, and the day range they span.
+
+    Every day, honeypot and protocol is selected and the duration range spans
+    all durations, so only rows without event time, duration, app or protocol drop.
+    """
+    index = build_event_index(df)
+    start_day, end_day = int(index.days.min()), int(index.days.max())
+    selections = {col: list(bitmaps) for col, bitmaps in index.bitmaps.items()}
+    durations = df['event_duration_sec']
+    filtered = filter_events(df, index, start_day, end_day, selections, durations.min(), durations.max())
+    return filtered, start_day, end_day
+
+def aggregate_shard(df, start_day, end_day):
+    df_ip = aggregate_data(df, start_day, end_day)
+    # aggregate_data reports errors with an empty frame, which would silently drop IPs
+    if df_ip.empty and df['src_ip'].notna().any():
+        raise RuntimeError("aggregating a shard failed")
+    return df_ip
+
+def build_ip_profiles(df, start_day, end_day, max_workers=None, n_shards=None):
+    """aggregate_data over src_ip shards in a process pool, merged in src_ip order."""
+    max_workers = max_workers or os.cpu_count()
+    n_shards = n_shards or max_workers
+    codes = shard_codes(df['src_ip'], n_shards)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(aggregate_shard, df[codes == shard], start_day, end_day)
+                   for shard in range(n_shards)]
+        shards = [future.result() for future in futures]
+    shards = [shard for shard in shards if not shard.empty]
+    if not shards:
+        return pd.DataFrame()
+    # groupby sorts each shard by src_ip, the merge restores the global order
+    return pd.concat(shards, ignore_index=True).sort_values('src_ip', ignore_index=True)
+
+def write_ip_profiles(profiles, path, metadata):
+    """Write the profiles to Parquet, with `metadata` describing the events they cover."""
+    table = pa.Table.from_pandas(profiles, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata,
+                                           PROFILE_METADATA_KEY: json.dumps(metadata).encode()})
+    tmp_path = Path(str(path) + '.tmp')
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+def read_ip_profiles(path):
+    """Return (profiles, metadata) as written by write_ip_profiles, in the aggregate_data layout."""
+    table = pq.read_table(path)
+    metadata = json.loads((table.schema.metadata or {}).get(PROFILE_METADATA_KEY, b'{}'))
+    profiles = table.to_pandas()
+    for col in HISTOGRAM_COLUMNS:
+        profiles[col] = [values.tolist() for values in profiles[col]]
+    return profiles, metadata
+
+def profile_metadata(events_df, start_day, end_day):
+    # lets the dashboard check the profiles were built from the events it loaded
+    return {'schema_version': SCHEMA_VERSION, 'start_day': start_day, 'end_day': end_day,
+            'n_events': len(events_df), 'last_event_time': str(events_df['event_time'].max())}
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the STINGAR per-IP profiles for the default filters.")
+    parser.add_argument('--output', default='ip_profiles.parquet', help="Parquet file to write")
+    parser.add_argument('--cache-dir', default=os.environ.get("STINGAR_CACHE_DIR", ".stingar_cache"),
+                        help="local event store, as used by the dashboard")
+    parser.add_argument('--prefix', default=None,
+                        help="sync new hourly files from this fsspec URL or directory first, e.g. gs://bucket/path")
+    parser.add_argument('--start', default=os.environ.get("STINGAR_START_DATE", "2023-10-01"),
+                        help="first day of the window (inclusive)")
+    parser.add_argument('--end', default=os.environ.get("STINGAR_END_DATE", "2023-10-30"),
+                        help="last day of the window (inclusive)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument('--shards', type=int, default=None, help="src_ip shards, one per worker by default")
+    args = parser.parse_args()
+
+    start, end = parse_window(args.start, args.end)
+    if args.prefix:
+        fs, prefix = fsspec.core.url_to_fs(args.prefix)
+        event_files = list_event_files(fs, prefix, start=start, end=end)
+        sync_event_store(fs, event_files, args.cache_dir)
+    else:
+        # the store can hold other prefixes too, keep the hours of the one the dashboard lists
+        event_files = store_paths(args.cache_dir, start, end,
+                                  prefix=os.environ.get("STINGAR_EVENTS_PREFIX", "stingar-events/clean"))
+    # the same files in the same order as the dashboard reads them
+    events_df = read_event_store(args.cache_dir, event_files)
+    if events_df.empty:
+        print("No events in the store for this window")
+        return
+    filtered_df, start_day, end_day = default_filter(events_df)
+    profiles = build_ip_profiles(filtered_df, start_day, end_day, max_workers=args.workers, n_shards=args.shards)
+    write_ip_profiles(profiles, args.output, profile_metadata(events_df, start_day, end_day))
+    print(f"Wrote {len(profiles)} IP profiles from {len(filtered_df)} events to {args.output}")
+
+if __name__ == "__main__":
+    main()
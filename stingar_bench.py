@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+
+from stingar_credentials import CredentialStats
+from stingar_data import (aggregate_data, build_event_index, filter_events, ip_histogram_lists, ip_value_lists,
+                          list_event_files, profile_order)
+from stingar_maps import (map_frames, points_for_zoom, style_ip_points, style_city_columns, style_globe_columns,
+                          IP_CELL_MEASURES, CITY_CELL_MEASURES)
+from stingar_hll import HLL_PRECISION
+from stingar_ips import network_rollup, parse_networks
+from stingar_rollup import aggregate_filtered, build_rollup
+from stingar_store import read_event_store, sync_event_store
+from stingar_synthetic import synthetic_events, write_event_files
+
+# Headless benchmark of the dashboard pipeline on synthetic events.
+# Each run appends one JSON line per invocation, tagged with the git commit,
+# so results of different commits can be compared on the same machine.
+
+DEFAULT_OUTPUT = 'bench_results.jsonl'
+# rows per page of the dashboard's attack details table
+DETAIL_ROWS = 100
+
+def git_commit():
+    # the commit of this checkout, whatever the working directory
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True, cwd=repo).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True, cwd=repo).stdout.strip())
+        return commit + ('-dirty' if dirty else '')
+    except Exception:
+        return None
+
+def max_rss_mib():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10
+
+def n_rows(value):
+    # rows of the frames a stage returns, None for other results
+    frames = [item for item in (value if isinstance(value, tuple) else (value,)) if isinstance(item, pd.DataFrame)]
+    return sum(len(frame) for frame in frames) if frames else None
+
+def deck_json(layer_type, df, **kwargs):
+    """Serialize a one-layer deck, the payload the browser receives."""
+    return pdk.Deck(layers=[pdk.Layer(layer_type, df, **kwargs)]).to_json()
+
+def pipeline_stages(events_df, fs, event_files, cache_dir):
+    """(name, function) of every benchmarked stage, in the order they run.
+
+    Each function takes the outputs of the earlier stages as a dict.
+    """
+    days = np.unique(events_df['day'].dropna().to_numpy(dtype=np.int32))
+    start_day, end_day = int(days[0]), int(days[-1])
+    apps = events_df['app'].unique().tolist()
+    protocols = events_df['protocol'].unique().tolist()
+    # a narrow selection: the busiest honeypot over the middle third of the window
+    narrow_apps = [events_df['app'].value_counts().index[0]]
+    narrow_start = start_day + (end_day - start_day) // 3
+    narrow_end = end_day - (end_day - start_day) // 3
+    # a quarter of the IPv4 space and the IPv6 documentation range
+    networks = parse_networks('64.0.0.0/2, 2001:db8::/32')
+
+    def page_ips(out):
+        return out['aggregate_filtered']['src_ip'].iloc[out['profile_order'][:DETAIL_ROWS]].tolist()
+
+    def full_durations(out):
+        edges = out['build_rollup'].duration_edges
+        return float(edges[0]), float(edges[-1])
+
+    stages = []
+    if event_files:
+        stages += [('store_sync', lambda out: sync_event_store(fs, event_files, cache_dir)),
+                   ('store_read', lambda out: read_event_store(cache_dir, event_files))]
+    stages += [
+        ('build_rollup', lambda out: build_rollup(events_df)),
+        ('build_rollup_sketches', lambda out: build_rollup(events_df, sketch_precision=HLL_PRECISION)),
+        ('build_event_index', lambda out: build_event_index(events_df)),
+        ('filter_events', lambda out: filter_events(events_df, out['build_event_index'], start_day, end_day,
+                                                    {'app': apps, 'protocol': protocols},
+                                                    *full_durations(out))),
+        ('filter_events_narrow', lambda out: filter_events(events_df, out['build_event_index'],
+                                                           narrow_start, narrow_end,
+                                                           {'app': narrow_apps, 'protocol': protocols},
+                                                           *full_durations(out))),
+        ('filter_events_cidr', lambda out: filter_events(events_df, out['build_event_index'], start_day, end_day,
+                                                         {'app': apps, 'protocol': protocols},
+                                                         *full_durations(out), networks=networks)),
+        ('aggregate_data', lambda out: aggregate_data(out['filter_events'], start_day, end_day)),
+        # as the dashboard calls it, with the value lists and sparklines left for the displayed page
+        ('aggregate_filtered', lambda out: aggregate_filtered(out['build_rollup'], out['filter_events'],
+                                                              start_day, end_day, apps, protocols,
+                                                              *full_durations(out), include_lists=False,
+                                                              include_histograms=False)),
+        ('aggregate_filtered_narrow', lambda out: aggregate_filtered(out['build_rollup'],
+                                                                     out['filter_events_narrow'],
+                                                                     narrow_start, narrow_end, narrow_apps,
+                                                                     protocols, *full_durations(out),
+                                                                     include_lists=False, include_histograms=False)),
+        ('aggregate_filtered_approx', lambda out: aggregate_filtered(out['build_rollup_sketches'],
+                                                                     out['filter_events'], start_day, end_day,
+                                                                     apps, protocols, *full_durations(out),
+                                                                     include_lists=False, approximate=True,
+                                                                     include_histograms=False)),
+        # the first page of the details table, sorted by address
+        ('profile_order', lambda out: profile_order(out['aggregate_filtered'], sort_by='src_ip', ascending=True)),
+        ('ip_value_lists', lambda out: ip_value_lists(out['filter_events'], page_ips(out))),
+        ('ip_histogram_lists', lambda out: ip_histogram_lists(out['filter_events'], page_ips(out),
+                                                              start_day, end_day)),
+        ('network_rollup', lambda out: network_rollup(out['aggregate_filtered'], 24)),
+        ('credential_stats', lambda out: CredentialStats().update(out['filter_events'])),
+        ('map_frames', lambda out: map_frames(out['filter_events'], out['aggregate_filtered'])),
+        ('map_ip_points', lambda out: style_ip_points(points_for_zoom(out['map_frames'][0], 1.0, 'total_events',
+                                                                      IP_CELL_MEASURES))),
+        ('map_city_columns', lambda out: style_city_columns(points_for_zoom(out['map_frames'][1], 1.7, 'count',
+                                                                            CITY_CELL_MEASURES))),
+        ('map_globe_columns', lambda out: style_globe_columns(out['map_frames'][2])),
+        ('deck_json', lambda out: (deck_json('ScatterplotLayer', out['map_ip_points'],
+                                             get_position='[longitude, latitude]', get_radius='norm_size',
+                                             get_fill_color='[fill_r, fill_g, fill_b]'),
+                                   deck_json('ColumnLayer', out['map_city_columns'],
+                                             get_position='[longitude, latitude]', get_elevation='count',
+                                             get_fill_color='[fill_r, fill_g, fill_b]'))),
+    ]
+    return stages
+
+def run_stages(stages, measure_memory):
+    """Run the stages once, returning {stage: (seconds, peak MiB or None, rows out)}."""
+    results, out = {}, {}
+    for name, func in stages:
+        if measure_memory:
+            tracemalloc.start()
+            base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        out[name] = func(out)
+        seconds = time.perf_counter() - started
+        peak = None
+        if measure_memory:
+            peak = (tracemalloc.get_traced_memory()[1] - base) / 2 ** 20
+            tracemalloc.stop()
+        results[name] = (seconds, peak, n_rows(out[name]))
+    return results
+
+def run_benchmark(rows, days=30, seed=0, repeat=3, measure_memory=True, ingest=False):
+    """Benchmark every stage on `rows` synthetic events and return the result record.
+
+    Times are the best of `repeat` runs. Memory is the tracemalloc peak of one
+    extra run, kept apart since tracing slows the timed code down. With
+    `ingest`, the events are also written as hourly CSV files and the local
+    store is synced and read back, starting from an empty store every run,
+    and a RuntimeError is raised unless every generated event is read back.
+    """
+    started = time.perf_counter()
+    events_df = synthetic_events(rows, days=days, seed=seed)
+    generate_seconds = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fs = fsspec.filesystem('file')
+        event_files = []
+        if ingest:
+            write_event_files(f"{tmp}/events", rows, days=days, seed=seed)
+            event_files = list_event_files(fs, f"{tmp}/events")
+        runs = []
+        for run in range(repeat + measure_memory):
+            # every run ingests into its own empty store
+            stages = pipeline_stages(events_df, fs, event_files, f"{tmp}/cache_{run}")
+            runs.append(run_stages(stages, measure_memory=measure_memory and run == repeat))
+            # a file the ingest skipped would make the store stages time less work than generated
+            if ingest and runs[-1]['store_read'][2] != rows:
+                raise RuntimeError(f"store_read returned {runs[-1]['store_read'][2]} of {rows} generated events")
+
+    stages = []
+    for name in runs[0]:
+        seconds = min(run[name][0] for run in runs[:repeat])
+        stages.append({'stage': name,
+                       'seconds': round(seconds, 4),
+                       'peak_mib': round(runs[-1][name][1], 1) if measure_memory else None,
+                       'rows_out': runs[0][name][2]})
+    return {'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'rows': rows, 'days': days, 'seed': seed, 'repeat': repeat,
+            'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'generate_seconds': round(generate_seconds, 2),
+            'frame_mib': round(events_df.memory_usage(deep=True).sum() / 2 ** 20, 1),
+            'max_rss_mib': round(max_rss_mib(), 1),
+            'stages': stages}
+
+def read_results(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def previous_result(results, record):
+    """Latest earlier result of the same workload, or None."""
+    for result in reversed(results):
+        if all(result.get(key) == record[key] for key in ('rows', 'days', 'seed')):
+            return result
+    return None
+
+def print_record(record, baseline=None):
+    print(f"commit {record['commit']}  rows {record['rows']:,}  days {record['days']}  "
+          f"frame {record['frame_mib']} MiB  max RSS {record['max_rss_mib']} MiB")
+    before = {stage['stage']: stage['seconds'] for stage in baseline['stages']} if baseline else {}
+    if baseline:
+        print(f"compared with {baseline['commit']} ({baseline['timestamp']})")
+    for stage in record['stages']:
+        line = f"  {stage['stage']:<28}{stage['seconds']:>10.4f} s"
+        if stage['peak_mib'] is not None:
+            line += f"{stage['peak_mib']:>10.1f} MiB"
+        if stage['rows_out'] is not None:
+            line += f"{stage['rows_out']:>12,} rows"
+        if before.get(stage['stage']):
+            line += f"{stage['seconds'] / before[stage['stage']]:>8.2f}x"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the STINGAR dashboard pipeline on synthetic events.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000],
+                        help="event counts to benchmark, e.g. 10000 1000000 50000000")
+    parser.add_argument('--days', type=int, default=30, help="days in the synthetic window")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage, the best is kept")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--ingest', action='store_true',
+                        help="also benchmark syncing and reading the Parquet store from hourly CSV files")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="JSON lines file the results are appended to")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        record = run_benchmark(rows, days=args.days, seed=args.seed, repeat=args.repeat,
+                               measure_memory=not args.no_memory, ingest=args.ingest)
+        print_record(record, previous_result(read_results(args.output), record))
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+if __name__ == "__main__":
+    main()
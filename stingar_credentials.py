@@ -0,0 +1,138 @@
+import ast
+import heapq
+from collections import Counter
+from functools import lru_cache
+
+import pandas as pd
+
+# Top-K analytics of the credentials and commands sent to the honeypots.
+# Counts are built incrementally, one batch of events at a time, either
+# exactly or within a fixed memory budget: Space-Saving keeps `capacity`
+# candidates and reports every value whose count exceeds n / capacity,
+# each count overestimated by at most its error
+
+KINDS = ['username', 'password', 'credential', 'command']
+KIND_LABELS = {'username': 'Usernames', 'password': 'Passwords',
+               'credential': 'Username / password pairs', 'command': 'Commands'}
+
+@lru_cache(maxsize=65536)
+def parse_list(text):
+    """Values of one list-literal export cell such as "['root', 'admin']"."""
+    if not isinstance(text, str) or text in ('', '[]'):
+        return ()
+    if text.startswith('['):
+        try:
+            values = ast.literal_eval(text)
+            if isinstance(values, (list, tuple)):
+                return tuple(str(value) for value in values)
+        except (ValueError, SyntaxError):
+            pass
+    return (text,)
+
+def count_values(values):
+    """Count every value of a list column, parsing each distinct cell once."""
+    counts = Counter()
+    for text, n in values.value_counts().items():
+        for value in parse_list(text):
+            counts[value] += n
+    return counts
+
+def count_credentials(usernames, passwords):
+    """Count the username / password pairs, matching the attempts of a cell by position."""
+    counts = Counter()
+    pairs = pd.DataFrame({'username': usernames, 'password': passwords}).value_counts()
+    for (username, password), n in pairs.items():
+        for pair in zip(parse_list(username), parse_list(password)):
+            counts[' / '.join(pair)] += n
+    return counts
+
+def count_batch(df):
+    """Counts of each kind in one batch of events."""
+    return {'username': count_values(df['username']),
+            'password': count_values(df['password']),
+            'credential': count_credentials(df['username'], df['password']),
+            'command': count_values(df['hp_data_commands'])}
+
+class SpaceSaving:
+    """Top-K summary that keeps at most `capacity` counters."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # (count, value) min-heap; entries whose count is out of date are skipped when popped
+        self.heap = []
+
+    def push(self, value):
+        heapq.heappush(self.heap, (self.counts[value], value))
+        if len(self.heap) > 2 * self.capacity:
+            # drop the stale entries before they outnumber the live ones
+            self.heap = [(count, value) for value, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def pop_smallest(self):
+        while True:
+            count, value = heapq.heappop(self.heap)
+            if self.counts.get(value) == count:
+                return value
+
+    def update(self, counts):
+        # heavier values first, so light ones are the ones evicted
+        for value, n in sorted(counts.items(), key=lambda item: -item[1]):
+            if value in self.counts:
+                self.counts[value] += n
+            elif len(self.counts) < self.capacity:
+                self.counts[value] = n
+                self.errors[value] = 0
+            else:
+                # the newcomer takes over the smallest counter and inherits its count as error
+                smallest = self.pop_smallest()
+                floor = self.counts.pop(smallest)
+                del self.errors[smallest]
+                self.counts[value] = floor + n
+                self.errors[value] = floor
+            self.push(value)
+
+    def top(self, n):
+        """(value, count, max overestimate) of the `n` largest counters."""
+        values = sorted(self.counts, key=self.counts.get, reverse=True)[:n]
+        return [(value, self.counts[value], self.errors[value]) for value in values]
+
+class CredentialStats:
+    """Counts of usernames, passwords, credential pairs and commands, updated batch by batch.
+
+    Exact when `capacity` is None, otherwise each kind keeps a Space-Saving
+    summary of `capacity` counters.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.n_events = 0
+        self.totals = dict.fromkeys(KINDS, 0)
+        if capacity is None:
+            self.counters = {kind: Counter() for kind in KINDS}
+        else:
+            self.counters = {kind: SpaceSaving(capacity) for kind in KINDS}
+
+    @property
+    def exact(self):
+        return self.capacity is None
+
+    def update(self, df):
+        """Add a batch of events with the username, password and hp_data_commands columns."""
+        self.n_events += len(df)
+        for kind, counts in count_batch(df).items():
+            self.totals[kind] += sum(counts.values())
+            self.counters[kind].update(counts)
+        return self
+
+    def top(self, kind, n=10):
+        """The `n` most common values of `kind` with their count and share of all values."""
+        if self.exact:
+            rows = [(value, count, 0) for value, count in self.counters[kind].most_common(n)]
+        else:
+            rows = self.counters[kind].top(n)
+        top = pd.DataFrame(rows, columns=['value', 'count', 'max_error'])
+        top['share'] = top['count'] / max(self.totals[kind], 1)
+        return top
+
@@ -1,11 +1,53 @@
 import streamlit as st
+import os
+import time
+import functools
+from contextlib import nullcontext
 import numpy as np
 import pandas as pd
 import pydeck as pdk
+from pydeck.io.html import deck_to_html
 from st_files_connection import FilesConnection
+from stingar_data import SCHEMA_VERSION, LIST_COLUMNS, ip_value_lists, ip_histogram_lists, profile_order, list_event_files, parse_window, day_label, build_event_index, filter_event_chunks
+from stingar_store import sync_event_store, read_event_store, iter_event_store
+from stingar_rollup import build_rollup, aggregate_filtered, duration_bucket_range, sketches_apply, sketch_total
+from stingar_hll import HLL_PRECISION, hll_error
+from stingar_maps import (map_frames, points_for_zoom, style_ip_points, style_city_columns, style_globe_columns,
+                          IP_CELL_MEASURES, CITY_CELL_MEASURES)
+from stingar_batch import read_ip_profiles
+from stingar_credentials import CredentialStats, KINDS, KIND_LABELS
+from stingar_diagnostics import start_trace, stage, count_cache_call, count_cache_miss, log_trace
+from stingar_live import LiveTail
+from stingar_ips import parse_networks, network_rollup
+import json
 import warnings
 warnings.filterwarnings('ignore')
 
+EVENTS_PREFIX = os.environ.get("STINGAR_EVENTS_PREFIX", "stingar-events/clean")
+# ingest window, both dates inclusive
+EVENTS_START, EVENTS_END = parse_window(os.environ.get("STINGAR_START_DATE", "2023-10-01"),
+                                        os.environ.get("STINGAR_END_DATE", "2023-10-30"))
+CACHE_DIR = os.environ.get("STINGAR_CACHE_DIR", ".stingar_cache")
+COUNTRIES_GEOJSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ne_110m_countries.geojson")
+# per-IP profiles precomputed by stingar_batch.py, served for the default filters
+IP_PROFILES_PATH = os.environ.get("STINGAR_IP_PROFILES", "")
+# rows per page of the attack details table, and networks listed when grouped by network
+DETAIL_ROWS = int(os.environ.get("STINGAR_DETAIL_ROWS", "100"))
+# counters per list for the whole-window credential counts, exact when unset
+TOPK_CAPACITY = int(os.environ["STINGAR_TOPK_CAPACITY"]) if os.environ.get("STINGAR_TOPK_CAPACITY") else None
+# HyperLogLog estimates of the distinct ports, sensors and sessions instead of exact counts
+APPROX_DISTINCT = os.environ.get("STINGAR_APPROX_DISTINCT", "0") == "1"
+# grouping options of the attack details table, the IPv4 prefix length of the network rollups
+DETAIL_GROUPINGS = {"Source IP": None, "/24 and IPv6 /48 networks": 24, "/16 and IPv6 /32 networks": 16}
+# sort options of the attack details table and the profile columns they sort by
+DETAIL_SORTS = {"Total events": 'total_events', "Last seen": 'last_seen', "First seen": 'first_seen',
+                "Peak attack duration": 'peak_duration_sec', "Age (in days)": 'age_in_days',
+                "Source IP": 'src_ip', "ASN": 'asn', "Country": 'country'}
+# poll for new hourly files every this many seconds and fold them in, off when 0
+LIVE_REFRESH_SEC = float(os.environ.get("STINGAR_LIVE_REFRESH_SEC", "0"))
+# inline the deck.gl bundle into the globe HTML so it renders without the CDN
+GLOBE_OFFLINE = os.environ.get("STINGAR_GLOBE_OFFLINE", "0") == "1"
+
 def set_page_config():
     st.set_page_config(
         page_title='STINGAR Dashboard',
@@ -14,136 +56,177 @@ def set_page_config():
         #page_icon='🌍'
     )
 
-@st.cache_data
+def traced_cache(func=None, **cache_args):
+    """st.cache_data that also counts calls and misses for the diagnostics panel.
+
+    Used bare or with st.cache_data arguments, e.g. @traced_cache(max_entries=32).
+    """
+    if func is None:
+        return functools.partial(traced_cache, **cache_args)
+
+    @functools.wraps(func)
+    def compute(*args, **kwargs):
+        # only reached when st.cache_data has no entry for the arguments
+        count_cache_miss(func.__name__)
+        return func(*args, **kwargs)
+    cached = st.cache_data(compute, **cache_args)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        count_cache_call(func.__name__)
+        return cached(*args, **kwargs)
+    wrapper.clear = cached.clear
+    return wrapper
+
+@traced_cache
+def load_event_files():
+    # the source files of the window; the store can also hold hours of other prefixes
+    try:
+        conn = st.connection('gcs', type=FilesConnection)
+        # only the hours that were actually exported are listed, missing ones are skipped
+        with stage('list_event_files') as record:
+            event_files = list_event_files(conn.fs, EVENTS_PREFIX, start=EVENTS_START, end=EVENTS_END)
+            record['rows_out'] = len(event_files)
+        # past hours are kept in a local columnar store, only new hours are fetched
+        with stage('sync_event_store', rows_in=len(event_files)) as record:
+            record['rows_out'] = sync_event_store(conn.fs, event_files, CACHE_DIR)
+        return event_files
+    except Exception as e:
+        print(f"Error listing event files: {e}")
+        return []
+
+@traced_cache
 def load_data():
     try:     
-        conn = st.connection('gcs', type=FilesConnection)
-        csv_data_list = []
-        for day in range(1, 31):
-            for hour in range(0, 24):
-                if (day==2 and hour in [10, 11]) or (day==3 and hour in [4])  or (day==13 and hour in [1]) or (day==18 and hour in [15]) or (day==19 and hour in [2, 15]) or (day==20 and hour in [6, 7, 8]) or (day==22 and hour in [12] or (day==24 and hour in [19]) or (day==27 and hour in [16]) or (day==30 and hour in [22])):
-                    continue
-                # print(f"stingar-events/clean/events_2023_10_{day:02d}_{hour:02d}.csv")
-                d = conn.read(f"stingar-events/clean/events_2023_10_{day:02d}_{hour:02d}.csv", input_format="csv", ttl=600)
-                csv_data_list.append(d)
-
-        data = pd.concat(csv_data_list, ignore_index=True)
-        df = data.loc[:, ['src_ip', 'src_port', 'dst_ip', 'event_time', 'start_time', 'end_time', 
-                          'hostname', 'sensor_uuid',
-                          'asn', 'asn_org', 'city', 'country', 'registered_country', 
-                          'latitude', 'longitude', 
-                          'app', 'protocol', 'hp_data_session',
-                          'hp_data_commands', 'username', 'password']]
-        df['event_time'] = pd.to_datetime(df['event_time'])
-        df['start_time'] = pd.to_datetime(df['start_time'])
-        df['end_time'] = pd.to_datetime(df['end_time'])
-        df['date'] = df['event_time'].dt.strftime('%Y-%m-%d')
-        df['hour'] = df['event_time'].dt.hour
-        df['day_name'] = df['event_time'].dt.day_name()
-        df['event_duration_sec'] = (df['end_time'] - df['start_time']).dt.total_seconds().round(2)
-        df['hostname'] = df['hostname'].fillna('NA')
-        df = df.replace({'[]': np.nan})
-        df = df.sort_values('event_time').reset_index(drop=True)
+        event_files = load_event_files()
+        with stage('read_event_store', rows_in=len(event_files)) as record:
+            df = read_event_store(CACHE_DIR, event_files)
+            record['rows_out'] = len(df)
         return df
     except Exception as e:
         print(f"Error loading data: {e}")
         return pd.DataFrame()
 
-def collect_unique_list(values):
-    res = set(value for value in values if pd.notnull(value))
-    if res==[]:
-        return np.nan
-    else:
-        return list(res)
-    
-def aggregate_data(df, start_date, end_date):
+@traced_cache
+def load_rollup():
+    # built once per load so filter changes only re-aggregate the rollup cells
+    return build_rollup(load_data(), sketch_precision=HLL_PRECISION if APPROX_DISTINCT else None)
+
+@traced_cache
+def load_event_index():
+    return build_event_index(load_data())
+
+def filter_domains(chunks, rollup):
+    # one option per distinct day, duration bucket edge and indexed value instead of one per event
+    # missing apps and protocols are offered as None, so the default selection keeps those rows
+    days = np.concatenate([index.days for _, index in chunks])
+    return {'days': np.unique(days).tolist(),
+            'durations': rollup.duration_edges.tolist(),
+            'apps': list(dict.fromkeys(value for _, index in chunks for value in index.bitmaps['app'])),
+            'protocols': list(dict.fromkeys(value for _, index in chunks for value in index.bitmaps['protocol']))}
+
+def option_label(value):
+    # missing apps and protocols show as NA, as missing hostnames do
+    return 'NA' if value is None else value
+
+@traced_cache
+def load_filter_domains():
+    return filter_domains([(load_data(), load_event_index())], load_rollup())
+
+@st.cache_resource
+def live_tail():
+    # one tail per process, shared by all sessions
+    conn = st.connection('gcs', type=FilesConnection)
+    return LiveTail(conn.fs, EVENTS_PREFIX, CACHE_DIR, EVENTS_START, EVENTS_END, topk_capacity=TOPK_CAPACITY,
+                    sketch_precision=HLL_PRECISION if APPROX_DISTINCT else None)
+
+def wait_for_refresh(seconds):
+    # a widget change interrupts the script at its next st call, so wait in short steps
+    countdown = st.sidebar.empty()
+    for remaining in range(int(np.ceil(seconds)), 0, -1):
+        countdown.caption(f"Checking for new events in {remaining}s")
+        time.sleep(min(1, seconds))
+    st.rerun()
+
+@traced_cache
+def load_ip_profiles(path, modified):
+    # `modified` is part of the cache key, so a rewritten file is read again
     try:
-        # Aggregate data based on criteria
-        df_ip = df.groupby('src_ip', as_index=False).agg({'event_time':[('total_events', 'count'), 
-                                                                    ('timestamp_list', collect_unique_list), 
-                                                                    ('first_seen', 'min'),
-                                                                    ('last_seen', 'max')], 
-                                                'hostname': [('hostname', 'first')],
-                                                'src_port':[('n_src_ports', 'nunique')],
-                                                'event_duration_sec': [('avg_duration_sec', 'mean'), 
-                                                                       ('std_duration_sec', 'std'), 
-                                                                       ('peak_duration_sec', 'max')],
-                                                'date': [('age_in_days', 'nunique')],
-                                                'app': [('app_list', 'unique'), 
-                                                        ('n_apps', 'nunique')],
-                                                'protocol': [('protocol_list', 'unique'), 
-                                                             ('n_protocols', 'nunique')],
-                                                'sensor_uuid': [('n_sensors', 'nunique')],
-                                                'hp_data_session': [('n_sessions', 'nunique')],
-                                                'hp_data_commands': [('command_list', 'unique')],
-                                                'username': [('username_list', 'unique')],
-                                                'password': [('password_list', 'unique')],
-                                                'asn': [('asn', 'min')],
-                                                'asn_org': [('asn_org', 'first')],
-                                                'city': [('city', 'first')],
-                                                'country': [('country', 'first')],
-                                                'latitude': [('latitude', 'min')],
-                                                'longitude': [('longitude', 'min')]
-                                               })
-        df_ip.columns = ['src_ip'] + df_ip.columns.get_level_values(1)[1:].to_list()
-        # Extracting event counts per day
-        df_ip['countby_day'] = df_ip['timestamp_list'].apply(lambda x: pd.to_datetime(x).floor('D') \
-                                                             .value_counts().reindex(pd.date_range(start=start_date, 
-                                                                                                   end=end_date, tz='UTC'), 
-                                                                                                   fill_value=0).tolist())
-
-        # Extracting event counts by day of the week
-        # Monday is 0 and Sunday is 6
-        df_ip['countby_dayofweek'] = df_ip['timestamp_list'].apply(lambda x: pd.to_datetime(x) \
-                                                                   .dayofweek.value_counts() \
-                                                                   .reindex(range(0, 7), 
-                                                                            fill_value=0).tolist())
-
-        # Extracting event counts by hour of the day
-        df_ip['countby_hourofday'] = df_ip['timestamp_list'].apply(lambda x: pd.to_datetime(x).hour \
-                                                                   .value_counts().reindex(range(0, 24), 
-                                                                                           fill_value=0).tolist())
-        
-        return df_ip
-    
+        profiles, metadata = read_ip_profiles(path)
     except Exception as e:
-        print(f"Error aggregating data: {e}")
-        return pd.DataFrame()
-
-def get_filtered_df(events_df):
+        print(f"Error loading IP profiles: {e}")
+        return None
+    events_df = load_data()
+    days = load_filter_domains()['days']
+    # only use profiles built from exactly the events this process loaded
+    if (metadata.get('schema_version') != SCHEMA_VERSION or metadata.get('n_events') != len(events_df)
+            or metadata.get('last_event_time') != str(events_df['event_time'].max())
+            or metadata.get('start_day') != days[0] or metadata.get('end_day') != days[-1]):
+        print(f"Ignoring IP profiles in {path}, they were built from other events")
+        return None
+    return profiles
+
+def get_filtered_df(chunks, rollup, domains, ip_profiles=None):
     st.sidebar.header("Filter by Events")
     with st.sidebar:
         # event filters
         st.markdown("##### Select time period")
         start_date, end_date = st.select_slider(label="-", label_visibility="collapsed",
-                                                options=events_df.date, 
-                                                value=(events_df.date.min(), events_df.date.max()))
+                                                options=domains['days'], 
+                                                value=(domains['days'][0], domains['days'][-1]),
+                                                format_func=day_label)
         st.markdown("##### Select attack duration (in seconds)")
         start_duration, end_duration = st.select_slider(label="Event duration (in seconds)",  
                                                         label_visibility="collapsed", 
-                                                        options=events_df.event_duration_sec.sort_values(), 
-                                                        value=(events_df.event_duration_sec.min(), 
-                                                               events_df.event_duration_sec.max()))
+                                                        options=domains['durations'], 
+                                                        value=(domains['durations'][0], 
+                                                               domains['durations'][-1]))
         st.markdown("##### Select honeypot types")
         with st.expander("List of honeypots"):
             select_app = st.multiselect(label="-", label_visibility="collapsed", 
-                                        options=events_df.app.unique(), 
-                                        default=events_df.app.unique())
+                                        options=domains['apps'], 
+                                        default=domains['apps'],
+                                        format_func=option_label)
         st.markdown("##### Select desired protocols")
         with st.expander("List of protocols"):
             select_protocol = st.multiselect(label="Select protocols", 
                                              label_visibility="collapsed", 
-                                             options=events_df.protocol.unique(), 
-                                             default=events_df.protocol.unique())
-        
+                                             options=domains['protocols'], 
+                                             default=domains['protocols'],
+                                             format_func=option_label)
+        st.markdown("##### Select source networks")
+        networks_text = st.text_input(label="Source networks", label_visibility="collapsed",
+                                      placeholder="All, or CIDR blocks such as 45.0.0.0/8, 2001:db8::/32",
+                                      key="source_networks")
+        try:
+            networks = parse_networks(networks_text)
+        except ValueError as e:
+            st.error(str(e))
+            networks = []
 
-    # Filtered events dataframe
-    events_df_filtered = events_df[events_df.date.between(start_date,end_date)]
-    events_df_filtered = events_df_filtered[events_df_filtered.app.isin(select_app)]
-    events_df_filtered = events_df_filtered[events_df_filtered.protocol.isin(select_protocol)]
-    events_df_filtered =  events_df_filtered[events_df_filtered.event_duration_sec.between(start_duration, end_duration)]
 
-    ip_df = aggregate_data(events_df_filtered, start_date, end_date)
+    # Filtered events dataframe
+    with stage('filter_events', rows_in=sum(len(df) for df, _ in chunks)) as record:
+        events_df_filtered = filter_event_chunks(chunks, start_date, end_date,
+                                                 {'app': select_app, 'protocol': select_protocol},
+                                                 start_duration, end_duration, networks=networks)
+        record['rows_out'] = len(events_df_filtered)
+
+    default_filters = ((start_date, end_date) == (domains['days'][0], domains['days'][-1])
+                       and (start_duration, end_duration) == (domains['durations'][0], domains['durations'][-1])
+                       and set(select_app) == set(domains['apps'])
+                       and set(select_protocol) == set(domains['protocols'])
+                       and not networks)
+    if ip_profiles is not None and default_filters:
+        ip_df = ip_profiles
+    else:
+        with stage('aggregate_filtered', rows_in=len(events_df_filtered)) as record:
+            # credential lists and sparklines are only built for the page shown in the details table
+            ip_df = aggregate_filtered(rollup, events_df_filtered, start_date, end_date,
+                                       select_app, select_protocol, start_duration, end_duration,
+                                       include_lists=False, approximate=APPROX_DISTINCT, networks=networks,
+                                       include_histograms=False)
+            record['rows_out'] = len(ip_df)
 
     st.sidebar.header("Filter by IP Addresses")
     with st.sidebar:
@@ -176,9 +259,18 @@ def get_filtered_df(events_df):
         ip_df_filtered = ip_df_filtered.nlargest(top_n_duration, 'peak_duration_sec')
         events_df_filtered = events_df_filtered[events_df_filtered['src_ip'].isin(ip_df_filtered.src_ip)]
 
-    return events_df_filtered, ip_df_filtered
+    # distinct sessions of the selection, merged from the sketches of the selected IPs
+    n_sessions = None
+    bucket_range = duration_bucket_range(rollup.duration_edges, start_duration, end_duration)
+    if APPROX_DISTINCT and sketches_apply(rollup, bucket_range):
+        selected_ips = ip_df_filtered.src_ip if show_top_n_by_total or show_top_n_by_duration or networks else None
+        with stage('sketch_total'):
+            n_sessions = sketch_total(rollup, 'n_sessions', start_date, end_date, select_app, select_protocol,
+                                      selected_ips)
+
+    return events_df_filtered, ip_df_filtered, n_sessions, (start_date, end_date)
 
-def display_metrics(events_df_filtered, ip_df_filtered):
+def display_metrics(events_df_filtered, ip_df_filtered, n_sessions=None):
     st.write(
         """
         <style>
@@ -194,12 +286,18 @@ def display_metrics(events_df_filtered, ip_df_filtered):
 
         kpi1, kpi2, kpi3, kpi4, kpi5 = st.columns(5)
         total_events = ip_df_filtered.total_events.sum()
-        avg_events_per_day = int(events_df_filtered.groupby('date').size().mean())
+        avg_events_per_day = int(events_df_filtered.groupby('day').size().mean())
+        # the distinct sessions are only shown when the sketches give them without a pass over the events
+        sessions_help = ""
+        if n_sessions is not None:
+            sessions_help = (f" About {round(n_sessions):,} distinct sessions, a HyperLogLog estimate "
+                             f"with a typical error of ±{hll_error(HLL_PRECISION):.1%}.")
         kpi1.metric(
             label="Total Attacks",
             value=round(total_events),
             delta=f"{avg_events_per_day} per day",
             help=f"Total count of events in the selected time period with a daily average of {avg_events_per_day}."
+                 f"{sessions_help}"
         )
 
         unique_ips = len(ip_df_filtered)
@@ -223,7 +321,7 @@ def display_metrics(events_df_filtered, ip_df_filtered):
         )
 
         total_asn = ip_df_filtered.asn.nunique()
-        top_asn = ip_df_filtered.groupby('asn_org')['total_events'].sum().nlargest(1).index.values[0]
+        top_asn = ip_df_filtered.groupby('asn_org', observed=True)['total_events'].sum().nlargest(1).index.values[0]
         kpi4.metric(
             label="Total ASNs",
             value=total_asn, 
@@ -232,7 +330,7 @@ def display_metrics(events_df_filtered, ip_df_filtered):
         )
 
         total_countries = ip_df_filtered.country.nunique()
-        top_country = ip_df_filtered.groupby('country')['total_events'].sum().nlargest(1).index.values[0]
+        top_country = ip_df_filtered.groupby('country', observed=True)['total_events'].sum().nlargest(1).index.values[0]
         kpi5.metric(
             label="Total Countries",
             value=total_countries, 
@@ -254,7 +352,7 @@ def get_scatter_layer(ip_df_plot):
             radius_max_pixels=100,
             get_position="[longitude, latitude]",
             get_radius="norm_size",
-            get_fill_color="fill_color",
+            get_fill_color="[fill_r, fill_g, fill_b]",
         )
 
 def get_column_layer(events_by_city_df):
@@ -263,7 +361,7 @@ def get_column_layer(events_by_city_df):
             events_by_city_df,
             get_position="[longitude, latitude]",
             get_elevation="count",
-            get_fill_color="fill_color",
+            get_fill_color="[fill_r, fill_g, fill_b]",
             auto_highlight=True,
             radius=20000,
             elevation_scale=100,
@@ -285,16 +383,20 @@ def get_globe_column_layer(globe_df):
                 pickable=True,
                 auto_highlight=True,
                 radius=100000,
-                get_fill_color='app_color',
+                get_fill_color='[fill_r, fill_g, fill_b]',
             )
 
-def get_geojson_layer():
-    COUNTRIES = "https://d2ad6b4ur7yvpq.cloudfront.net/naturalearth-3.3.0/ne_50m_admin_0_scale_rank.geojson"
+@traced_cache
+def load_countries_geojson():
+    # simplified Natural Earth 1:110m countries, vendored so the globe needs no CDN
+    with open(COUNTRIES_GEOJSON, 'r', encoding='utf-8') as f:
+        return json.load(f)
 
+def get_geojson_layer():
     return pdk.Layer(
             "GeoJsonLayer",
             id="base-map",
-            data=COUNTRIES,
+            data=load_countries_geojson(),
             stroked=True,
             filled=True,
         wireframe=True,
@@ -317,96 +419,180 @@ def render_pydeck_chart(layers, initial_view_state, tooltip):
     chart = pdk.Deck(layers=layers, initial_view_state=initial_view_state, tooltip=tooltip)
     return st.pydeck_chart(chart)
 
-def map_globe_color(app):
-            """Return a green RGB value if a facility uses a renewable fuel type"""
-            if app.lower() in ("cowrie"):
-                return [0, 255, 0]
-            return [0, 0, 255]
+# every filter combination is another entry of 170 KB, or 2.2 MB with the bundle inlined
+GLOBE_CACHE_ENTRIES = 32
+
+@traced_cache(max_entries=GLOBE_CACHE_ENTRIES)
+def render_globe_html(globe_df, longitude=0, latitude=0, zoom=0.8):
+    # cached on the content of globe_df and the view, rendered in memory
+    # instead of through a file shared by every session
+    geo_layer = get_geojson_layer()
+    column_layer =  get_globe_column_layer(globe_df)
+    view_state = get_pydeck_viewport(longitude=longitude, latitude=latitude, zoom=zoom)
+    tooltip={"text": "Sensor type: {app} \n Count: {count}\n Location: {country}"}
+    view = pdk.View(type="_GlobeView", controller=True)
+    deck = pdk.Deck(
+        views=[view],
+        initial_view_state=view_state,
+        tooltip=tooltip,
+        layers=[geo_layer, column_layer],
+        map_provider=None,
+        # Note that this must be set for the globe to be opaque
+        parameters={"cull": False},
+    )
+    # pydeck pretty-prints the deck JSON, the compact form is a fraction of the size
+    deck_json = json.dumps(json.loads(deck.to_json()), separators=(',', ':'))
+    return deck_to_html(deck_json, tooltip=tooltip, css_background_color="black",
+                        as_string=True, notebook_display=False, offline=GLOBE_OFFLINE)
 
 def display_map(ip_df_plot, events_by_city_df, globe_df):
     map1, map2, map3 = st.tabs(["Aggregated by IP Address", 
                                 "Aggregated by city", 
                                 "Aggregated by country and honeypot type"])
     
-    COLOUR_RANGE = [[255,255,178],[254,217,118],[254,178,76],[253,141,60],[240,59,32],[189,0,38]]
-    
-    # map size to log of total events
-    radius_unit = 100000 # in meters
-    radius_scale = 2
-    ip_df_plot['total_events_log'] = ip_df_plot["total_events"].apply(lambda x: np.log1p(x))
-    max = ip_df_plot.loc[:,'total_events_log'].max(axis=0)
-    min = ip_df_plot.loc[:,'total_events_log'].min(axis=0)
-    ip_df_plot['norm_size'] = ((ip_df_plot['total_events_log'] / (max - min))*radius_unit*radius_scale)
-
-    # map color range to log of peak duration
-    ip_df_plot["peak_duration_log"] = ip_df_plot["peak_duration_sec"].apply(lambda x: np.log1p(x))
-    max = ip_df_plot.loc[:,'peak_duration_log'].max(axis=0)
-    min = ip_df_plot.loc[:,'peak_duration_log'].min(axis=0)
-    ip_df_plot.loc[:,'fillColorIndex'] = ( (ip_df_plot.loc[:,'peak_duration_log']-min) / (max-min) )*(len(COLOUR_RANGE) - 1)
-    ip_df_plot = ip_df_plot.fillna(1)
-    ip_df_plot.loc[:,'fill_color'] = ip_df_plot.loc[:,'fillColorIndex'].map(lambda x: COLOUR_RANGE[int(x)])
-
-    #map color for map2 by count
-    events_by_city_df["count_log"] = events_by_city_df["count"].apply(lambda x: np.log1p(x))
-    max = events_by_city_df.loc[:,'count_log'].max(axis=0)
-    min = events_by_city_df.loc[:,'count_log'].min(axis=0)
-    events_by_city_df.loc[:,'fillColorIndex'] = ( (events_by_city_df.loc[:,'count_log']-min) / (max-min) )*(len(COLOUR_RANGE) - 1)
-    events_by_city_df.loc[:,'fill_color'] = events_by_city_df.loc[:,'fillColorIndex'].map(lambda x: COLOUR_RANGE[int(x)])
-
     #map color for map3 to app
-    globe_df["app_color"] = globe_df["app"].apply(map_globe_color)
+    globe_df = style_globe_columns(globe_df)
 
     with map1:
         st.caption('The size of the bubble represents total number of attacks.  \
                    \nThe color represents average duration of attack.')
+        zoom = st.slider("Zoom level", min_value=1.0, max_value=8.0, value=1.0, step=0.1, key="ip_map_zoom",
+                         help="Large selections are binned into map cells sized for this zoom level.")
+        with stage('bin_ip_points', rows_in=len(ip_df_plot)) as record:
+            ip_df_plot = points_for_zoom(ip_df_plot, zoom, weight='total_events', measures=IP_CELL_MEASURES)
+            # map size to log of total events, color range to log of peak duration
+            ip_df_plot = style_ip_points(ip_df_plot)
+            record['rows_out'] = len(ip_df_plot)
+
         scatter_layer = get_scatter_layer(ip_df_plot)
-        view_state = get_pydeck_viewport(longitude=0, latitude=0, zoom=1, min_zoom=1, pitch=0, bearing=0)
-        tooltip={"text": "IP: {src_ip}\n Hostname: {hostname}\n Total Events: {total_events}\n  \
-                        Attack duration: {peak_duration_sec} seconds \n \
-                        ASN: {asn_org}\n Location: {city}, {country}"}
-        render_pydeck_chart(layers=[scatter_layer], initial_view_state=view_state, tooltip=tooltip)
+        view_state = get_pydeck_viewport(longitude=0, latitude=0, zoom=zoom, min_zoom=1, pitch=0, bearing=0)
+        if 'n_points' in ip_df_plot.columns:
+            tooltip={"text": "IPs: {n_points}\n Top IP: {src_ip}\n Total Events: {total_events}\n  \
+                            Peak attack duration: {peak_duration_sec} seconds \n \
+                            Top location: {city}, {country}"}
+        else:
+            tooltip={"text": "IP: {src_ip}\n Hostname: {hostname}\n Total Events: {total_events}\n  \
+                            Attack duration: {peak_duration_sec} seconds \n \
+                            ASN: {asn_org}\n Location: {city}, {country}"}
+        with stage('render_ip_map', rows_in=len(ip_df_plot)):
+            render_pydeck_chart(layers=[scatter_layer], initial_view_state=view_state, tooltip=tooltip)
         
 
     with map2:
         st.caption("The length of the extruded bar represents number of attacks from a city.")
+        zoom = st.slider("Zoom level", min_value=1.0, max_value=8.0, value=1.7, step=0.1, key="city_map_zoom",
+                         help="Large selections are binned into map cells sized for this zoom level.")
+        with stage('bin_city_columns', rows_in=len(events_by_city_df)) as record:
+            events_by_city_df = points_for_zoom(events_by_city_df, zoom, weight='count', measures=CITY_CELL_MEASURES)
+            #map color for map2 by count
+            events_by_city_df = style_city_columns(events_by_city_df)
+            record['rows_out'] = len(events_by_city_df)
+
         column_layer = get_column_layer(events_by_city_df)
-        view_state = get_pydeck_viewport(longitude=12, latitude=-40, zoom=1.7, min_zoom=1, pitch=60.5, bearing=0)
-        tooltip={"text": "Count: {count}\n City: {city} \n Country: {country}"}
-        render_pydeck_chart(layers=[column_layer], initial_view_state=view_state, tooltip=tooltip)
+        view_state = get_pydeck_viewport(longitude=12, latitude=-40, zoom=zoom, min_zoom=1, pitch=60.5, bearing=0)
+        if 'n_points' in events_by_city_df.columns:
+            tooltip={"text": "Count: {count}\n Locations: {n_points}\n Top city: {city} \n Country: {country}"}
+        else:
+            tooltip={"text": "Count: {count}\n City: {city} \n Country: {country}"}
+        with stage('render_city_map', rows_in=len(events_by_city_df)):
+            render_pydeck_chart(layers=[column_layer], initial_view_state=view_state, tooltip=tooltip)
         
 
     with map3:
         st.caption("For each country, the :green[green] bars represent attacks on :green[cowrie] \
                    while :blue[blue] represent :blue[conpot].")
-        geo_layer = get_geojson_layer()
-        column_layer =  get_globe_column_layer(globe_df)
-        view_state = get_pydeck_viewport(longitude=0, latitude=0, zoom=0.8)
-        tooltip={"text": "Sensor type: {app} \n Count: {count}\n Location: {country}"}
-        # Set height and width variables
-        view = pdk.View(type="_GlobeView", controller=True)
-        deck = pdk.Deck(
-            views=[view],
-            initial_view_state=view_state,
-            tooltip=tooltip,
-            layers=[geo_layer, column_layer],
-            map_provider=None,
-            # Note that this must be set for the globe to be opaque
-            parameters={"cull": False},
-        )
-
-        deck.to_html("globe_view.html", css_background_color="black")
-        html_file = open("globe_view.html", 'r', encoding='utf-8')
-        source_code = html_file.read() 
-        st.components.v1.html(source_code, height=500, scrolling=True) 
+        with stage('render_globe', rows_in=len(globe_df)):
+            source_code = render_globe_html(globe_df, longitude=0, latitude=0, zoom=0.8)
+            st.components.v1.html(source_code, height=500, scrolling=True) 
         
 
-def display_attack_details(ip_df_filtered):
+@traced_cache
+def load_credential_stats():
+    # counted hour by hour over the files load_data reads, only the credential columns
+    stats = CredentialStats(capacity=TOPK_CAPACITY)
+    for df in iter_event_store(CACHE_DIR, load_event_files(), columns=LIST_COLUMNS):
+        stats.update(df)
+    return stats
+
+def display_top_credentials(events_df_filtered, live=None):
+    with st.expander("Top credentials and commands :arrow_down_small:"):
+        scope_col, n_col = st.columns(2)
+        scope = scope_col.radio("Count over", ["Selected events", "Whole window"], horizontal=True,
+                                key="credential_scope")
+        top_n = n_col.slider("Top N", min_value=5, max_value=50, value=10, step=5, key="credential_top_n")
+        lock = nullcontext()
+        if scope == "Selected events":
+            stats = CredentialStats().update(events_df_filtered)
+        else:
+            # the live counts are updated in place by polls
+            stats, lock = (live.credentials, live.lock) if live is not None else (load_credential_stats(), lock)
+            if not stats.exact:
+                st.caption(f"Approximate counts kept in {stats.capacity} counters per list, "
+                           "a count may be overestimated by at most its error.")
+        for column, kind in zip(st.columns(len(KINDS)), KINDS):
+            with lock:
+                top = stats.top(kind, top_n)
+            column.markdown(f"###### {KIND_LABELS[kind]}")
+            if top.empty:
+                column.write("-")
+                continue
+            if stats.exact:
+                top = top.drop(columns='max_error')
+            column.dataframe(top, hide_index=True,
+                             column_config={"value": st.column_config.TextColumn(KIND_LABELS[kind][:-1]),
+                                            "count": "Count", "max_error": "Error",
+                                            "share": st.column_config.ProgressColumn("Share", format="%.2f",
+                                                                                     min_value=0, max_value=1)})
+
+def display_network_details(details, ip_df_filtered, v4_prefix):
+    # blocks of addresses scanning together stand out here even when each address is quiet
+    networks = network_rollup(ip_df_filtered, v4_prefix)
+    if len(networks) > DETAIL_ROWS:
+        details.caption(f"Showing the {DETAIL_ROWS} networks with the most events out of {len(networks)}.")
+    networks = networks.head(DETAIL_ROWS)
+    networks = networks.astype({col: 'object' for col in networks.select_dtypes('category')}).fillna("-")
+    networks.columns = ['Network', 'IP Addresses', 'Total Events', 'First Seen', 'Last Seen',
+                        'Peak Attack Duration (seconds)', 'ASNs', 'Top IP', 'Top Asn Org', 'Top Country']
+    details.dataframe(networks, hide_index=True)
+
+def display_attack_details(ip_df_filtered, events_df_filtered, period):
     details = st.expander("Attack details :arrow_down_small:")
-    ip_df_details = ip_df_filtered.loc[:, ['src_ip', 'hostname', 'app_list', 'protocol_list',
+    grouping = details.radio("Group by", list(DETAIL_GROUPINGS), horizontal=True, key="details_grouping")
+    if DETAIL_GROUPINGS[grouping] is not None:
+        display_network_details(details, ip_df_filtered, DETAIL_GROUPINGS[grouping])
+        return
+    search_col, sort_col, order_col = details.columns([2, 1, 1])
+    search = search_col.text_input("Search", placeholder="IP, ASN or country", key="details_search")
+    sort_label = sort_col.selectbox("Sort by", list(DETAIL_SORTS), key="details_sort")
+    ascending = order_col.radio("Order", ["Descending", "Ascending"], horizontal=True,
+                                key="details_order") == "Ascending"
+    # sorting and searching run here on the profiles, only the page shown is sent to the browser
+    with stage('profile_order', rows_in=len(ip_df_filtered)) as record:
+        order = profile_order(ip_df_filtered, search.strip(), DETAIL_SORTS[sort_label], ascending)
+        record['rows_out'] = len(order)
+    if len(order) == 0:
+        details.write("No IPs match this search.")
+        return
+    n_pages = -(-len(order) // DETAIL_ROWS)
+    page = details.number_input(f"Page (of {n_pages})", min_value=1, value=1, step=1, key="details_page")
+    page = min(int(page), n_pages)
+    start = (page - 1) * DETAIL_ROWS
+    end = min(start + DETAIL_ROWS, len(order))
+    details.caption(f"Showing IPs {start + 1}-{end} of {len(order)}.")
+    ip_df_details = ip_df_filtered.iloc[order[start:end]]
+    # value lists and sparklines are fetched for the rows of this page rather than for every IP
+    page_ips = ip_df_details['src_ip'].tolist()
+    if 'username_list' not in ip_df_details.columns:
+        ip_df_details = ip_df_details.join(ip_value_lists(events_df_filtered, page_ips), on='src_ip')
+    if 'countby_day' not in ip_df_details.columns:
+        ip_df_details = ip_df_details.join(ip_histogram_lists(events_df_filtered, page_ips, *period), on='src_ip')
+    ip_df_details = ip_df_details.loc[:, ['src_ip', 'hostname', 'app_list', 'protocol_list',
                                         'total_events', 'first_seen', 'last_seen', 'peak_duration_sec', 'age_in_days' , 
                                         'asn', 'asn_org', 'city', 'country', 
                                         'countby_day', 'countby_dayofweek', 'countby_hourofday',
                                         'username_list', 'password_list']]
+    # categorical columns only accept known values, so widen them before filling gaps
+    ip_df_details = ip_df_details.astype({col: 'object' for col in ip_df_details.select_dtypes('category')})
     ip_df_details = ip_df_details.fillna("-")
     ip_df_details.columns = ['Source IP', 'Hostname', 'Honeypot Type', 'Protocols',
                                         'Total Events', 'First Seen', 'Last Seen', 'Peak Attack Duration (seconds)', 'Age (in days)' , 
@@ -414,7 +600,7 @@ def display_attack_details(ip_df_filtered):
                                         'countby_day', 'countby_dayofweek', 'countby_hourofday',
                                         'Usernames', 'Passwords']
     # if ~ip_df_filtered.empty:
-    details.dataframe(ip_df_details.sort_values('total_events', ascending=False).reset_index(drop=True), 
+    details.dataframe(ip_df_details.reset_index(drop=True), 
                           column_config={"countby_day": st.column_config.LineChartColumn("Events per day", 
                                                                                          help="shows events per day in the selected time period"),
                                     "countby_dayofweek": st.column_config.BarChartColumn("Attacks by day of week", 
@@ -424,7 +610,21 @@ def display_attack_details(ip_df_filtered):
     # else:
     #     details.write("No data for selected filters.")
 
+def display_diagnostics(summary):
+    with st.expander(f"Diagnostics: rerun took {summary['seconds']:.2f}s"):
+        stages = pd.DataFrame(summary['stages'])
+        # indent nested stages under the stage that ran them
+        stages['stage'] = ['· ' * depth + name for name, depth in zip(stages['stage'], stages['depth'])]
+        st.dataframe(stages.drop(columns='depth'), hide_index=True,
+                     column_config={"seconds": st.column_config.NumberColumn("Wall time (s)", format="%.4f"),
+                                    "rows_in": "Rows in", "rows_out": "Rows out",
+                                    "rss_delta_mib": st.column_config.NumberColumn("Memory delta (MiB)")})
+        cache = pd.DataFrame.from_dict(summary['cache'], orient='index').rename_axis('function').reset_index()
+        st.dataframe(cache, hide_index=True)
+
 def run_dashboard():
+    trace = start_trace()
+    live = None
     try:
         set_page_config()
         # Dashboard title
@@ -437,37 +637,64 @@ def run_dashboard():
                     '</div>', unsafe_allow_html=True)
      
         # load data
-        events_df = load_data()
+        if LIVE_REFRESH_SEC > 0:
+            live = live_tail()
+            # reruns of every session share one poll per refresh interval, which reads only the new files
+            if st.sidebar.toggle("Live updates", value=True, key="live_updates"):
+                with stage('live_poll') as record:
+                    record['rows_out'] = live.poll(min_interval=LIVE_REFRESH_SEC)
+            snapshot = live.snapshot
+            if snapshot is None:
+                st.write(":red[No events yet, waiting for the first hourly file.]")
+                return
+            # the events stay in the chunks they were appended in
+            chunks, rollup, n_events = snapshot.chunks, snapshot.rollup, snapshot.n_events
+            with stage('filter_domains'):
+                domains = filter_domains(chunks, rollup)
+            st.sidebar.caption(f"{n_events:,} events from {snapshot.n_files} hourly files, last new events "
+                               f"at {time.strftime('%H:%M:%S', time.localtime(snapshot.updated))}")
+        else:
+            with stage('load_data') as record:
+                events_df = load_data()
+                record['rows_out'] = len(events_df)
+            with stage('load_rollup', rows_in=len(events_df)) as record:
+                rollup = load_rollup()
+                record['rows_out'] = len(rollup.cells)
+            with stage('load_event_index', rows_in=len(events_df)):
+                event_index = load_event_index()
+            with stage('load_filter_domains'):
+                domains = load_filter_domains()
+            chunks, n_events = [(events_df, event_index)], len(events_df)
+        ip_profiles = None
+        if live is not None:
+            # running per-IP aggregates of the default filters
+            ip_profiles = snapshot.profiles
+        elif IP_PROFILES_PATH and os.path.exists(IP_PROFILES_PATH):
+            with stage('load_ip_profiles') as record:
+                ip_profiles = load_ip_profiles(IP_PROFILES_PATH, os.path.getmtime(IP_PROFILES_PATH))
+                record['rows_out'] = None if ip_profiles is None else len(ip_profiles)
         # Further processing and UI rendering
-        events_df_filtered, ip_df_filtered = get_filtered_df(events_df=events_df)
+        with stage('get_filtered_df', rows_in=n_events) as record:
+            events_df_filtered, ip_df_filtered, n_sessions, period = get_filtered_df(chunks=chunks, rollup=rollup,
+                                                                                     domains=domains,
+                                                                                     ip_profiles=ip_profiles)
+            record['rows_out'] = len(ip_df_filtered)
 
         if not events_df_filtered.empty:
-            display_metrics(events_df_filtered, ip_df_filtered)
+            with stage('display_metrics', rows_in=len(ip_df_filtered)):
+                display_metrics(events_df_filtered, ip_df_filtered, n_sessions)
 
             # Select columns to plot on map
-            events_df_plot = events_df_filtered[['event_time', 'app', 'src_ip', 
-                                                 'longitude', 'latitude', 'event_duration_sec', 
-                                                 'city', 'country', 'asn_org', 'asn', 'hostname']]
-            # events_df_plot['origin'] =  [[-81.0403481, 35.4310715] for _ in range(len(events_df_plot))]
-
-            ip_df_plot = ip_df_filtered[['src_ip', 'longitude', 'latitude', 
-                                         'total_events', 'peak_duration_sec', 
-                                         'city', 'country', 
-                                         'asn_org', 'asn', 'hostname']]
-            
-            events_by_city_df = events_df_plot.groupby(['latitude', 'longitude']).agg({
-                                                                    'city':[('city', 'first')],
-                                                                    'country':[('country', 'first')],
-                                                                    'event_time': [('count', 'count')]}).reset_index()
-            events_by_city_df.columns = ['latitude', 'longitude'] + events_by_city_df.columns.get_level_values(1)[2:].to_list()
-            globe_df = events_df_plot.groupby(['country', 'app']).agg({'latitude':[('latitude', 'mean')], 
-                                                                    'longitude':[('longitude', 'mean')],
-                                                                    'event_time': [('count', 'count')]}).reset_index()
-            globe_df.columns = ['country', 'app'] + globe_df.columns.get_level_values(1)[2:].to_list()
-            globe_df['origin'] =  [[-81.0403481, 35.4310715] for _ in range(len(globe_df))]
-
-            display_map(ip_df_plot, events_by_city_df, globe_df)
-            display_attack_details(ip_df_filtered)
+            with stage('map_frames', rows_in=len(events_df_filtered)) as record:
+                ip_df_plot, events_by_city_df, globe_df = map_frames(events_df_filtered, ip_df_filtered)
+                record['rows_out'] = len(ip_df_plot) + len(events_by_city_df) + len(globe_df)
+
+            with stage('display_map'):
+                display_map(ip_df_plot, events_by_city_df, globe_df)
+            with stage('display_top_credentials', rows_in=len(events_df_filtered)):
+                display_top_credentials(events_df_filtered, live)
+            with stage('display_attack_details', rows_in=len(ip_df_filtered)):
+                display_attack_details(ip_df_filtered, events_df_filtered, period)
         else:
             st.write(":red[This selection has no data.  \nChange the filters to include some data.]")
 
@@ -475,5 +702,17 @@ def run_dashboard():
         print(f"Error running dashboard: {e}")
         # Display error message or handle exception
 
+    finally:
+        if trace is not None:
+            try:
+                summary = trace.summary()
+                log_trace(summary)
+                display_diagnostics(summary)
+            except Exception as e:
+                print(f"Error reporting diagnostics: {e}")
+        # keep polling, also after an error, until live updates are switched off
+        if live is not None and st.session_state.get("live_updates", True):
+            wait_for_refresh(LIVE_REFRESH_SEC)
+
 if __name__ == "__main__":
     run_dashboard()
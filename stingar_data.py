@@ -0,0 +1,426 @@
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from stingar_ips import IPIndex, build_ip_index, encode_ips, network_rows
+
+# Hourly exports are named events_YYYY_MM_DD_HH.csv
+EVENT_FILE_PATTERN = re.compile(r'events_(\d{4})_(\d{2})_(\d{2})_(\d{2})\.csv$')
+
+EVENT_COLUMNS = ['src_ip', 'src_port', 'dst_ip', 'event_time', 'start_time', 'end_time',
+                 'hostname', 'sensor_uuid',
+                 'asn', 'asn_org', 'city', 'country', 'registered_country',
+                 'latitude', 'longitude',
+                 'app', 'protocol', 'hp_data_session',
+                 'hp_data_commands', 'username', 'password']
+
+# Bump whenever the cleaned frame changes shape, dtypes or encodings, cached partitions are rebuilt
+SCHEMA_VERSION = 5
+
+# Repeated strings are parsed straight into categoricals, free text stays object
+CATEGORY_COLUMNS = ['dst_ip', 'hostname', 'sensor_uuid', 'asn_org', 'city', 'country',
+                    'registered_country', 'app', 'protocol']
+CSV_DTYPES = {'src_ip': 'object', 'dst_ip': 'category', 'hostname': 'object',
+              'sensor_uuid': 'category', 'asn_org': 'category', 'city': 'category',
+              'country': 'category', 'registered_country': 'category',
+              'latitude': 'float32', 'longitude': 'float32',
+              'app': 'category', 'protocol': 'category', 'hp_data_session': 'object',
+              'hp_data_commands': 'object', 'username': 'object', 'password': 'object'}
+# nullable integers are cast after parsing since exports may write them as floats
+INTEGER_DTYPES = {'src_port': 'UInt16', 'asn': 'UInt32'}
+LIST_COLUMNS = ['hp_data_commands', 'username', 'password']
+# Columns of the per-IP profile built by aggregate_data, in order
+IP_PROFILE_COLUMNS = ['src_ip', 'ip_hi', 'ip_lo', 'total_events', 'first_seen', 'last_seen', 'hostname', 'n_src_ports',
+                      'avg_duration_sec', 'std_duration_sec', 'peak_duration_sec', 'age_in_days',
+                      'app_list', 'n_apps', 'protocol_list', 'n_protocols', 'n_sensors', 'n_sessions',
+                      'command_list', 'username_list', 'password_list',
+                      'asn', 'asn_org', 'city', 'country', 'latitude', 'longitude',
+                      'countby_day', 'countby_dayofweek', 'countby_hourofday']
+# per-IP lists of the values sent, built from LIST_COLUMNS in the same order
+VALUE_LIST_COLUMNS = ['command_list', 'username_list', 'password_list']
+# per-IP sparklines of the distinct event times
+HISTOGRAM_COLUMNS = ['countby_day', 'countby_dayofweek', 'countby_hourofday']
+DAY_NAMES = pd.CategoricalDtype(['Monday', 'Tuesday', 'Wednesday', 'Thursday',
+                                 'Friday', 'Saturday', 'Sunday'])
+# How each attribute of an IP is taken from its events, 'first' in event-time
+# order. The exact, rollup and live profiles all follow these rules.
+IP_ATTRIBUTES = {'ip_hi': 'first', 'ip_lo': 'first', 'hostname': 'first', 'asn': 'min', 'asn_org': 'first', 'city': 'first',
+                 'country': 'first', 'latitude': 'min', 'longitude': 'min'}
+
+def event_file_hour(path):
+    """Return the hour an event file covers, or None if the name does not match."""
+    match = EVENT_FILE_PATTERN.search(str(path))
+    if match is None:
+        return None
+    year, month, day, hour = (int(part) for part in match.groups())
+    return datetime(year, month, day, hour)
+
+def event_file_globs(prefix, start=None, end=None):
+    """Glob patterns covering the event files of [start, end), one per month when both are given."""
+    if start is None or end is None:
+        return [f"{prefix}/events_*.csv"]
+    patterns = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        patterns.append(f"{prefix}/events_{year:04d}_{month:02d}_*.csv")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return patterns
+
+def list_event_files(fs, prefix, start=None, end=None):
+    """List the hourly event files that actually exist under `prefix`.
+
+    `fs` is any fsspec filesystem, e.g. `conn.fs` of a FilesConnection for GCS
+    or `fsspec.filesystem('file')` with a local directory as prefix.
+    Files are kept when start <= hour < end and returned in time order.
+    """
+    prefix = str(prefix).rstrip('/')
+    # gcsfs caches listings, so drop them to pick up newly written hours
+    fs.invalidate_cache(prefix)
+    files = []
+    paths = [path for pattern in event_file_globs(prefix, start, end) for path in fs.glob(pattern)]
+    for path in paths:
+        hour = event_file_hour(path)
+        if hour is None:
+            continue
+        if start is not None and hour < start:
+            continue
+        if end is not None and hour >= end:
+            continue
+        files.append((hour, path))
+    return [path for _, path in sorted(files)]
+
+def read_event_file(fs, path, retries=3, backoff=0.5):
+    """Read one hourly CSV, retrying transient failures with exponential backoff."""
+    for attempt in range(retries):
+        try:
+            with fs.open(path, 'rb') as f:
+                return pd.read_csv(f, usecols=EVENT_COLUMNS, dtype=CSV_DTYPES)
+        except Exception:
+            if attempt == retries - 1:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+def iter_event_files(fs, paths, max_workers=16, retries=3):
+    """Fetch and parse event files concurrently with a bounded worker pool.
+
+    Yields (path, frame) pairs as files complete. Files that still fail after
+    `retries` attempts are skipped and reported. At most 2 * max_workers files
+    are in flight, so memory stays bounded however many paths are given.
+    """
+    paths = iter(paths)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def submit(n):
+            for path in islice(paths, n):
+                pending[pool.submit(read_event_file, fs, path, retries)] = path
+        submit(2 * max_workers)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    frame = future.result()
+                except Exception as e:
+                    print(f"Skipping {path}: {e}")
+                    continue
+                yield path, frame
+            submit(len(done))
+
+def day_code(times):
+    """Encode event times as nullable integer days since 1970-01-01 (UTC), <NA> for missing times."""
+    days = np.asarray(times.values, dtype='datetime64[D]')
+    missing = np.isnat(days)
+    return pd.arrays.IntegerArray(np.where(missing, 0, days.view(np.int64)).astype(np.int32), missing)
+
+def day_of_week(days):
+    """Day of week of integer day codes, Monday is 0 and Sunday is 6."""
+    # 1970-01-01 was a Thursday
+    return (days + 3) % 7
+
+def day_label(code):
+    """Format an integer day code as YYYY-MM-DD."""
+    return str(np.datetime64(int(code), 'D'))
+
+def iter_clean_events(fs, paths, max_workers=16, retries=3):
+    """Stream (path, cleaned frame) pairs, one hourly file at a time."""
+    for path, data in iter_event_files(fs, paths, max_workers=max_workers, retries=retries):
+        try:
+            df = clean_events(data)
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        yield path, df
+
+def parse_window(start, end):
+    """Turn inclusive 'YYYY-MM-DD' bounds into the [start, end) datetimes of the ingest window."""
+    start_day = date.fromisoformat(start)
+    end_day = date.fromisoformat(end)
+    return (datetime(start_day.year, start_day.month, start_day.day),
+            datetime(end_day.year, end_day.month, end_day.day) + timedelta(days=1))
+
+def clean_events(data):
+    """Project a raw event export to the dashboard schema and derive time fields."""
+    df = data.loc[:, EVENT_COLUMNS]
+    # exports mix whole-second and fractional timestamps, so the format is not inferred from the first row
+    df['event_time'] = pd.to_datetime(df['event_time'], format='ISO8601')
+    df['start_time'] = pd.to_datetime(df['start_time'], format='ISO8601')
+    df['end_time'] = pd.to_datetime(df['end_time'], format='ISO8601')
+    # rows without an event time are kept, with missing time fields
+    df['day'] = day_code(df['event_time'])
+    df['hour'] = df['event_time'].dt.hour.astype('Int8')
+    df['day_name'] = pd.Categorical.from_codes(day_of_week(df['day']).fillna(-1).to_numpy(np.int8),
+                                               dtype=DAY_NAMES)
+    df['event_duration_sec'] = (df['end_time'] - df['start_time']).dt.total_seconds().round(2)
+    df['hostname'] = df['hostname'].fillna('NA')
+    # integer addresses for CIDR filters and network rollups
+    df['ip_hi'], df['ip_lo'] = encode_ips(df['src_ip'])
+    df[LIST_COLUMNS] = df[LIST_COLUMNS].replace({'[]': np.nan})
+    df = df.astype(INTEGER_DTYPES)
+    df = df.astype({col: 'category' for col in CATEGORY_COLUMNS})
+    # sorted partitions usually concatenate into an already sorted frame
+    return df.sort_values('event_time').reset_index(drop=True)
+
+def concat_categorical(frames):
+    """Concatenate frames with the same columns, keeping categorical columns categorical.
+
+    Frames cleaned separately have different categories, which pd.concat would
+    turn into object columns, so the categories are unioned instead.
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    for col in frames[0].columns:
+        if not isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            continue
+        categories = [frame[col].cat.categories for frame in frames]
+        if all(values.equals(categories[0]) for values in categories[1:]):
+            continue
+        # recode the codes of every frame to the union, so the frame itself is copied once, by pd.concat
+        dtype = pd.CategoricalDtype(categories[0].append(categories[1:]).unique())
+        frames = [frame.copy(deep=False) for frame in frames]
+        for frame in frames:
+            frame[col] = frame[col].astype(dtype)
+    return pd.concat(frames, ignore_index=True)
+
+class EventIndex(NamedTuple):
+    days: np.ndarray
+    bitmaps: dict
+    ips: IPIndex
+
+def build_event_index(df, columns=('app', 'protocol')):
+    """Index the time-sorted events for filtering without intermediate frames.
+
+    `days` holds the day codes of the rows with an event time (they come first
+    and ascending), `bitmaps` a packed row bitmap for every value of `columns`,
+    with the rows missing a value under None, and `ips` the rows in address order.
+    """
+    n_timed = int(df['event_time'].notna().sum())
+    days = df['day'].iloc[:n_timed].to_numpy(dtype=np.int32)
+    bitmaps = {}
+    for col in columns:
+        codes = pd.Categorical(df[col])
+        bitmaps[col] = {value: np.packbits(codes.codes == code)
+                        for code, value in enumerate(codes.categories)}
+        if (codes.codes < 0).any():
+            bitmaps[col][None] = np.packbits(codes.codes < 0)
+    ips = build_ip_index(df['ip_hi'].to_numpy(), df['ip_lo'].to_numpy())
+    return EventIndex(days=days, bitmaps=bitmaps, ips=ips)
+
+def filter_events(df, index, start_day, end_day, selections, start_duration, end_duration, networks=None):
+    """Rows of `df` within the day range whose columns take one of the selected values
+    and whose duration is between the bounds, gathered with a single take.
+
+    `selections` maps the indexed columns to the allowed values. With
+    `networks`, as parsed by parse_networks, only source addresses inside one
+    of them are kept.
+    """
+    return df.take(filter_rows(df, index, start_day, end_day, selections, start_duration, end_duration, networks))
+
+def filter_rows(df, index, start_day, end_day, selections, start_duration, end_duration, networks=None):
+    """Positions of the rows filter_events keeps."""
+    # the rows of the date range are a contiguous slice of the sorted events
+    start, end = np.searchsorted(index.days, [start_day, end_day + 1])
+    if start >= end:
+        return np.array([], dtype=np.int64)
+    first_byte, last_byte = start // 8, (end + 7) // 8
+    packed = np.full(last_byte - first_byte, 0xFF, dtype=np.uint8)
+    for col, values in selections.items():
+        bitmaps = index.bitmaps[col]
+        selected = np.zeros_like(packed)
+        for value in values:
+            if value in bitmaps:
+                selected |= bitmaps[value][first_byte:last_byte]
+        packed &= selected
+    mask = np.unpackbits(packed)[start - first_byte * 8:end - first_byte * 8].astype(bool)
+    durations = df['event_duration_sec'].to_numpy()[start:end]
+    mask &= (durations >= start_duration) & (durations <= end_duration)
+    if networks:
+        mask &= network_rows(index.ips, networks, start, end)
+    return start + np.flatnonzero(mask)
+
+def filter_event_chunks(chunks, start_day, end_day, selections, start_duration, end_duration, networks=None):
+    """filter_events over a sequence of (events, EventIndex) chunks, with the rows in time order.
+
+    Chunks are filtered one by one, so events can be appended as a new chunk
+    without copying or re-indexing the earlier ones.
+    """
+    selected = []
+    for df, index in chunks:
+        rows = filter_rows(df, index, start_day, end_day, selections, start_duration, end_duration, networks)
+        if len(rows):
+            selected.append((df, rows))
+    if len(selected) <= 1:
+        df, rows = selected[0] if selected else (chunks[0][0], [])
+        return df.take(rows)
+    # chunks kept whole are concatenated as they are, without a take first
+    df = concat_categorical([df if len(rows) == len(df) else df.take(rows) for df, rows in selected])
+    # chunks overlap in time when a late file landed after newer ones
+    if not df['event_time'].is_monotonic_increasing:
+        df = df.sort_values('event_time', kind='stable', ignore_index=True)
+    return df
+
+def ip_histograms(ip_codes, times, n_ips, start_day, end_day):
+    """Count the distinct event times of each IP per day, day of week and hour of day.
+
+    `ip_codes` are row positions into the per-IP table (-1 for missing IPs) and
+    `times` the matching event times. Returns dense (n_ips, buckets) arrays for
+    days start_day..end_day, Monday..Sunday and hours 0..23 in a single pass.
+    """
+    ns = np.asarray(times.values, dtype='datetime64[ns]').view(np.int64)
+    valid = (ip_codes >= 0) & pd.notna(times.values)
+    # every distinct timestamp of an IP is counted once
+    pairs = pd.DataFrame({'ip': ip_codes[valid], 'ns': ns[valid]}).drop_duplicates()
+    ip = pairs['ip'].to_numpy()
+    day = pairs['ns'].to_numpy() // 86_400_000_000_000
+    hour = pairs['ns'].to_numpy() // 3_600_000_000_000 % 24
+    dayofweek = day_of_week(day)
+
+    n_days = end_day - start_day + 1
+    offset = day - start_day
+    in_range = (offset >= 0) & (offset < n_days)
+    countby_day = np.bincount(ip[in_range] * n_days + offset[in_range],
+                              minlength=n_ips * n_days).reshape(n_ips, n_days)
+    countby_dayofweek = np.bincount(ip * 7 + dayofweek, minlength=n_ips * 7).reshape(n_ips, 7)
+    countby_hourofday = np.bincount(ip * 24 + hour, minlength=n_ips * 24).reshape(n_ips, 24)
+    return countby_day, countby_dayofweek, countby_hourofday
+
+def profile_columns(include_lists=True, include_histograms=True):
+    """IP_PROFILE_COLUMNS, without the value lists or histograms unless asked for."""
+    return [col for col in IP_PROFILE_COLUMNS
+            if (include_lists or col not in VALUE_LIST_COLUMNS)
+            and (include_histograms or col not in HISTOGRAM_COLUMNS)]
+
+def ip_value_lists(df, src_ips):
+    """Command, username and password lists of the given IPs only, indexed by src_ip.
+
+    aggregate_data builds these for every IP, so views that show a few rows
+    can skip them there and fetch them here for the rows on screen.
+    """
+    rows = df[df['src_ip'].isin(src_ips)]
+    lists = rows.groupby('src_ip').agg(**{name: (col, 'unique') for col, name in zip(LIST_COLUMNS, VALUE_LIST_COLUMNS)})
+    return lists.reindex(pd.Index(src_ips, name='src_ip'))
+
+def ip_histogram_lists(df, src_ips, start_day, end_day):
+    """HISTOGRAM_COLUMNS of the given IPs only, indexed by src_ip, as ip_value_lists for the lists."""
+    rows = df[df['src_ip'].isin(src_ips)]
+    src_ips = pd.Index(src_ips, name='src_ip')
+    histograms = ip_histograms(src_ips.get_indexer(rows['src_ip']), rows['event_time'], len(src_ips),
+                               start_day, end_day)
+    return pd.DataFrame({col: counts.tolist() for col, counts in zip(HISTOGRAM_COLUMNS, histograms)}, index=src_ips)
+
+def contains_text(values, text):
+    # categorical columns are searched once per category instead of once per row
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        matches = values.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+        return np.isin(values.cat.codes.to_numpy(), np.flatnonzero(matches))
+    return values.astype('string').str.contains(text, case=False, regex=False).fillna(False).to_numpy(dtype=bool)
+
+def profile_order(ip_df, search='', sort_by='total_events', ascending=False):
+    """Positions of the per-IP profiles matching `search`, in `sort_by` order.
+
+    `search` is matched case-insensitively as a substring of the IP, ASN,
+    ASN organisation or country. 'src_ip' sorts by address rather than text.
+    """
+    positions = np.arange(len(ip_df))
+    if search:
+        mask = np.zeros(len(ip_df), dtype=bool)
+        for col in ['src_ip', 'asn', 'asn_org', 'country']:
+            mask |= contains_text(ip_df[col], search)
+        positions = positions[mask]
+    if sort_by == 'src_ip':
+        order = np.lexsort((ip_df['ip_lo'].to_numpy()[positions], ip_df['ip_hi'].to_numpy()[positions]))
+        return positions[order if ascending else order[::-1]]
+    values = ip_df[sort_by].iloc[positions]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # categories are in order of first appearance, not alphabetical
+        values = values.astype(object)
+    values.index = positions
+    return values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+def aggregate_data(df, start_date, end_date, include_lists=True, include_histograms=True):
+    try:
+        # Aggregate data based on criteria
+        aggregations = {'ip_hi': [('ip_hi', IP_ATTRIBUTES['ip_hi'])],
+                        'ip_lo': [('ip_lo', IP_ATTRIBUTES['ip_lo'])],
+                        'event_time':[('total_events', 'count'), 
+                                      ('first_seen', 'min'),
+                                      ('last_seen', 'max')], 
+                        'hostname': [('hostname', IP_ATTRIBUTES['hostname'])],
+                        'src_port':[('n_src_ports', 'nunique')],
+                        'event_duration_sec': [('avg_duration_sec', 'mean'), 
+                                               ('std_duration_sec', 'std'), 
+                                               ('peak_duration_sec', 'max')],
+                        'day': [('age_in_days', 'nunique')],
+                        'app': [('app_list', 'unique'), 
+                                ('n_apps', 'nunique')],
+                        'protocol': [('protocol_list', 'unique'), 
+                                     ('n_protocols', 'nunique')],
+                        'sensor_uuid': [('n_sensors', 'nunique')],
+                        'hp_data_session': [('n_sessions', 'nunique')],
+                        'hp_data_commands': [('command_list', 'unique')],
+                        'username': [('username_list', 'unique')],
+                        'password': [('password_list', 'unique')],
+                        'asn': [('asn', IP_ATTRIBUTES['asn'])],
+                        'asn_org': [('asn_org', IP_ATTRIBUTES['asn_org'])],
+                        'city': [('city', IP_ATTRIBUTES['city'])],
+                        'country': [('country', IP_ATTRIBUTES['country'])],
+                        'latitude': [('latitude', IP_ATTRIBUTES['latitude'])],
+                        'longitude': [('longitude', IP_ATTRIBUTES['longitude'])]
+                       }
+        if not include_lists:
+            # the object lists dominate memory, callers fetch them for shown rows via ip_value_lists
+            for col in LIST_COLUMNS:
+                del aggregations[col]
+        df_ip = df.groupby('src_ip', as_index=False).agg(aggregations)
+        df_ip.columns = ['src_ip'] + df_ip.columns.get_level_values(1)[1:].to_list()
+        # categorical columns come back as a Categorical per IP, keep plain arrays for display
+        for col in ['app_list', 'protocol_list']:
+            df_ip[col] = [np.asarray(values) for values in df_ip[col]]
+
+        if not include_histograms:
+            # views that show a page of rows fetch these for it via ip_histogram_lists
+            return df_ip
+
+        # groupby sorts by src_ip, so positions in the sorted uniques are row numbers of df_ip
+        ip_codes = pd.Index(df_ip['src_ip']).get_indexer(df['src_ip'])
+        countby_day, countby_dayofweek, countby_hourofday = ip_histograms(ip_codes, df['event_time'], len(df_ip),
+                                                                          start_date, end_date)
+        # Extracting event counts per day
+        df_ip['countby_day'] = countby_day.tolist()
+        # Extracting event counts by day of the week
+        # Monday is 0 and Sunday is 6
+        df_ip['countby_dayofweek'] = countby_dayofweek.tolist()
+        # Extracting event counts by hour of the day
+        df_ip['countby_hourofday'] = countby_hourofday.tolist()
+
+        return df_ip
+    
+    except Exception as e:
+        print(f"Error aggregating data: {e}")
+        return pd.DataFrame()
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Opt-in per-rerun instrumentation: wall time, rows in/out and memory delta of
+# each stage plus cache calls and misses. Every Streamlit session reruns the
+# script in its own thread, so the trace of the current rerun is thread-local.
+
+ENABLED = os.environ.get("STINGAR_DIAGNOSTICS", "0") == "1"
+# JSON lines file for the rerun summaries, "-" for stderr
+LOG_PATH = os.environ.get("STINGAR_DIAGNOSTICS_LOG", "")
+# reruns slower than this are logged as warnings, to alert on
+SLOW_RERUN_SEC = float(os.environ.get("STINGAR_SLOW_RERUN_SEC", "5"))
+
+logger = logging.getLogger("stingar.diagnostics")
+_local = threading.local()
+_handler_lock = threading.Lock()
+
+def rss_mib():
+    """Resident memory of the process in MiB, None where /proc is not available."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+class RunTrace:
+    """Stages and cache counts of one rerun."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.stages = []
+        self.cache = {}
+        self.depth = 0
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        # the caller may set 'rows_out' on the yielded record
+        record = {'stage': name, 'depth': self.depth, 'rows_in': rows_in, 'rows_out': None}
+        self.stages.append(record)
+        rss_before = rss_mib()
+        started = time.perf_counter()
+        self.depth += 1
+        try:
+            yield record
+        finally:
+            self.depth -= 1
+            record['seconds'] = round(time.perf_counter() - started, 4)
+            rss_after = rss_mib()
+            record['rss_delta_mib'] = (round(rss_after - rss_before, 1)
+                                       if rss_before is not None and rss_after is not None else None)
+
+    def count_cache(self, name, key):
+        counts = self.cache.setdefault(name, {'calls': 0, 'misses': 0})
+        counts[key] += 1
+
+    def summary(self):
+        seconds = round(time.perf_counter() - self.started, 4)
+        return {'timestamp': self.timestamp, 'seconds': seconds, 'rss_mib': rss_mib(),
+                'slow': seconds > SLOW_RERUN_SEC, 'stages': self.stages,
+                'cache': {name: {**counts, 'hits': counts['calls'] - counts['misses']}
+                          for name, counts in self.cache.items()}}
+
+def start_trace():
+    """Start tracing the current rerun, returns None when diagnostics are off."""
+    _local.trace = RunTrace() if ENABLED else None
+    return _local.trace
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+@contextmanager
+def stage(name, rows_in=None):
+    """Time a stage of the current rerun, a no-op when no trace is running."""
+    trace = current_trace()
+    if trace is None:
+        yield {}
+        return
+    with trace.stage(name, rows_in) as record:
+        yield record
+
+def count_cache_call(name):
+    trace = current_trace()
+    if trace is not None:
+        trace.count_cache(name, 'calls')
+
+def count_cache_miss(name):
+    # called from inside the cached function, so it only runs on a miss
+    trace = current_trace()
+    if trace is not None:
+        trace.count_cache(name, 'misses')
+
+def configure_log():
+    if not LOG_PATH or logger.handlers:
+        return
+    with _handler_lock:
+        if logger.handlers:
+            return
+        handler = logging.StreamHandler() if LOG_PATH == '-' else logging.FileHandler(LOG_PATH, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+def log_trace(summary):
+    """Log a rerun summary as one JSON line, as a warning when the rerun was slow."""
+    configure_log()
+    logger.log(logging.WARNING if summary['slow'] else logging.INFO, json.dumps(summary, default=str))
@@ -0,0 +1,148 @@
+import ipaddress
+import re
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+# Source addresses as two uint64 columns, the high and low halves of their
+# IPv6 form, with IPv4 addresses mapped into ::ffff:0:0/96. Sorting by
+# (ip_hi, ip_lo) keeps every CIDR block contiguous, so a block is one range
+# of the sorted index whatever its prefix length.
+
+IPV4_MAPPED = 0xffff << 32
+LOW_BITS = (1 << 64) - 1
+# missing and invalid addresses encode as ffff:...:ffff, a multicast address
+# that is never a source, and are left out of CIDR matches and network rollups
+INVALID_IP = (1 << 128) - 1
+# IPv4 prefix lengths of the network rollups and the IPv6 lengths they stand next to
+NETWORK_PREFIXES = {24: 48, 16: 32}
+
+def ip_number(address):
+    """128-bit number of an address, IPv4 addresses mapped into IPv6."""
+    if address.version == 4:
+        return IPV4_MAPPED | int(address)
+    return int(address)
+
+def encode_ips(values):
+    """Encode address strings as (ip_hi, ip_lo) uint64 arrays.
+
+    Each distinct address is parsed once. Missing or invalid addresses
+    encode as INVALID_IP, see valid_ips.
+    """
+    codes, uniques = pd.factorize(values)
+    # one extra slot, where the -1 code of missing values lands
+    hi = np.full(len(uniques) + 1, INVALID_IP >> 64, dtype=np.uint64)
+    lo = np.full(len(uniques) + 1, INVALID_IP & LOW_BITS, dtype=np.uint64)
+    for i, text in enumerate(uniques):
+        try:
+            number = ip_number(ipaddress.ip_address(text))
+        except ValueError:
+            continue
+        hi[i] = number >> 64
+        lo[i] = number & LOW_BITS
+    return hi[codes], lo[codes]
+
+def valid_ips(hi, lo):
+    """Mask of the (hi, lo) addresses that encode a parsed address rather than INVALID_IP."""
+    hi, lo = np.asarray(hi, dtype=np.uint64), np.asarray(lo, dtype=np.uint64)
+    return (hi != np.uint64(INVALID_IP >> 64)) | (lo != np.uint64(INVALID_IP & LOW_BITS))
+
+def parse_networks(text):
+    """Parse comma or space separated CIDR blocks into [(first, last)] address numbers.
+
+    A bare address is a block of one. Raises ValueError naming the first
+    block that does not parse.
+    """
+    networks = []
+    for block in re.split(r'[,\s]+', text.strip()):
+        if not block:
+            continue
+        try:
+            network = ipaddress.ip_network(block, strict=False)
+        except ValueError:
+            raise ValueError(f"{block} is not a CIDR block such as 45.0.0.0/8 or 2001:db8::/32")
+        networks.append((ip_number(network.network_address), ip_number(network.broadcast_address)))
+    return networks
+
+def in_networks(hi, lo, networks):
+    """Mask of the (hi, lo) addresses inside any of the `networks`, for small tables."""
+    hi, lo = np.asarray(hi, dtype=np.uint64), np.asarray(lo, dtype=np.uint64)
+    mask = np.zeros(len(hi), dtype=bool)
+    for first, last in networks:
+        first_hi, first_lo = np.uint64(first >> 64), np.uint64(first & LOW_BITS)
+        last_hi, last_lo = np.uint64(last >> 64), np.uint64(last & LOW_BITS)
+        above = (hi > first_hi) | ((hi == first_hi) & (lo >= first_lo))
+        below = (hi < last_hi) | ((hi == last_hi) & (lo <= last_lo))
+        mask |= above & below
+    return mask & valid_ips(hi, lo)
+
+class IPIndex(NamedTuple):
+    # row positions in address order and the sorted addresses
+    order: np.ndarray
+    hi: np.ndarray
+    lo: np.ndarray
+
+def build_ip_index(hi, lo):
+    order = np.lexsort((lo, hi))
+    return IPIndex(order=order, hi=hi[order], lo=lo[order])
+
+def search(index, number, side):
+    # bisect the high halves, then the low halves among equal high halves
+    number_hi, number_lo = np.uint64(number >> 64), np.uint64(number & LOW_BITS)
+    start, end = np.searchsorted(index.hi, number_hi, 'left'), np.searchsorted(index.hi, number_hi, 'right')
+    return start + np.searchsorted(index.lo[start:end], number_lo, side)
+
+def network_rows(index, networks, start=0, end=None):
+    """Mask over rows start..end of the rows whose address is inside any of the `networks`."""
+    end = len(index.order) if end is None else end
+    mask = np.zeros(end - start, dtype=bool)
+    # INVALID_IP is the largest address, so rows with an invalid address sort last and are cut off
+    n_valid = search(index, INVALID_IP, 'left')
+    for first, last in networks:
+        rows = index.order[min(search(index, first, 'left'), n_valid):min(search(index, last, 'right'), n_valid)]
+        rows = rows[(rows >= start) & (rows < end)]
+        mask[rows - start] = True
+    return mask
+
+def network_keys(hi, lo, v4_prefix, v6_prefix):
+    """(hi, lo, prefix length) of the network of each address, prefix lengths counted in IPv6 bits."""
+    hi, lo = np.asarray(hi, dtype=np.uint64), np.asarray(lo, dtype=np.uint64)
+    is_v4 = (hi == 0) & ((lo >> np.uint64(32)) == np.uint64(0xffff))
+    prefix = np.where(is_v4, 96 + v4_prefix, v6_prefix)
+    return hi & prefix_mask(np.minimum(prefix, 64)), lo & prefix_mask(np.clip(prefix - 64, 0, 64)), prefix
+
+def prefix_mask(bits):
+    # the top `bits` of 64 set, a shift by 64 is undefined so full masks are set apart
+    bits = np.asarray(bits).astype(np.uint64)
+    ones = np.uint64(LOW_BITS)
+    return np.where(bits == 64, ones, ~(ones >> (bits % np.uint64(64))))
+
+def format_network(hi, lo, prefix):
+    number = (int(hi) << 64) | int(lo)
+    if prefix >= 96 and number >> 32 == 0xffff:
+        return str(ipaddress.IPv4Network((number & 0xffffffff, int(prefix) - 96)))
+    return str(ipaddress.IPv6Network((number, int(prefix))))
+
+def network_rollup(ip_df, v4_prefix=24, v6_prefix=None):
+    """Totals per network of a per-IP profile table, IPv4 /v4_prefix and IPv6 /v6_prefix blocks.
+
+    Scanning runs spread over many addresses of one block show up as one
+    busy network here even when each address is quiet.
+    """
+    v6_prefix = NETWORK_PREFIXES[v4_prefix] if v6_prefix is None else v6_prefix
+    ip_df = ip_df[valid_ips(ip_df['ip_hi'], ip_df['ip_lo'])]
+    net_hi, net_lo, prefix = network_keys(ip_df['ip_hi'], ip_df['ip_lo'], v4_prefix, v6_prefix)
+    # the busiest IP of each network comes first and names its ASN and country
+    by_events = ip_df.assign(net_hi=net_hi, net_lo=net_lo, prefix=prefix).sort_values('total_events',
+                                                                                       ascending=False)
+    networks = by_events.groupby(['net_hi', 'net_lo', 'prefix'], sort=False, observed=True).agg(
+        n_ips=('src_ip', 'count'), total_events=('total_events', 'sum'),
+        first_seen=('first_seen', 'min'), last_seen=('last_seen', 'max'),
+        peak_duration_sec=('peak_duration_sec', 'max'), n_asns=('asn', 'nunique'),
+        top_ip=('src_ip', 'first'), asn_org=('asn_org', 'first'), country=('country', 'first'))
+    networks = networks.reset_index()
+    networks.insert(0, 'network', [format_network(*key) for key in zip(networks['net_hi'], networks['net_lo'],
+                                                                       networks['prefix'])])
+    return networks.drop(columns=['net_hi', 'net_lo', 'prefix']).sort_values('total_events', ascending=False,
+                                                                              ignore_index=True)
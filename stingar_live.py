@@ -0,0 +1,286 @@
+import threading
+import time
+from itertools import compress
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from stingar_credentials import CredentialStats
+from stingar_data import (IP_ATTRIBUTES, build_event_index, concat_categorical, day_code, day_of_week,
+                          list_event_files, profile_columns)
+from stingar_rollup import Rollup, build_rollup, duration_std, extend_rollup, merge_moments
+from stingar_store import iter_event_store, read_manifest, sync_event_store
+
+# Live tail of the hourly exports. Each poll ingests only the source files that
+# appeared since the previous one and folds their events into running state.
+# The events are kept as time-sorted chunks with an index each, so a refresh
+# does not copy or re-index the events already loaded; it costs work in
+# proportion to the new rows plus a pass over the per-IP state and rollup cells.
+
+# rows missing one of these never pass the sidebar filters
+REQUIRED_COLUMNS = ['src_ip', 'event_time', 'event_duration_sec', 'app', 'protocol']
+# distinct counts kept exactly, as sets of (src_ip, value) hashes
+DISTINCT_MEASURES = {'n_src_ports': 'src_port', 'n_sensors': 'sensor_uuid', 'n_sessions': 'hp_data_session'}
+# per-IP lists kept in order of first event time, so a late file does not reorder them
+ORDERED_LISTS = {'app_list': 'app', 'protocol_list': 'protocol'}
+# how the running totals of two batches combine; the duration moments
+# dur_mean and dur_m2 are merged by merge_moments
+TOTALS = {**IP_ATTRIBUTES, 'total_events': 'sum', 'first_seen': 'min', 'last_seen': 'max',
+          'n_rows': 'sum', 'peak_duration_sec': 'max'}
+# 'first' is in event-time order as in aggregate_data, so the totals keep the
+# time of each of these values and a late file can still provide the first one
+FIRST_COLUMNS = [col for col, how in TOTALS.items() if how == 'first']
+
+def add_counts(counts, batch):
+    # running counts in a dict, updated only at the keys of the batch
+    for key, count in batch.items():
+        counts[key] = counts.get(key, 0) + int(count)
+
+class IPState:
+    """Running per-IP aggregates of the events seen so far.
+
+    Histograms count distinct event times per batch, hourly files hold
+    disjoint hours so a timestamp does not come back in a later batch.
+    profiles() only rebuilds the IPs updated since its last call.
+    """
+
+    def __init__(self):
+        self.totals = None
+        self.seen = {measure: set() for measure in DISTINCT_MEASURES}
+        self.distinct = {measure: {} for measure in DISTINCT_MEASURES}
+        # {src_ip: {value: first event time}} per list
+        self.lists = {name: {} for name in ORDERED_LISTS}
+        # {(src_ip, day code): count} and {(src_ip, hour): count} of distinct event times
+        self.day_counts = {}
+        self.hour_counts = {}
+        # {src_ip: day codes with events}
+        self.days = {}
+        # profiles returned last, their day range and the IPs updated since
+        self.last_profiles = None
+        self.last_days = None
+        self.touched = set()
+
+    def update(self, df):
+        """Add a time-sorted batch of cleaned events."""
+        rows = df.dropna(subset=REQUIRED_COLUMNS)
+        if rows.empty:
+            return self
+        durations = rows['event_duration_sec']
+        deviations = durations - durations.groupby(rows['src_ip'], sort=False).transform('mean')
+        batch = rows.assign(duration_dev2=deviations ** 2).groupby('src_ip', sort=False).agg(
+            total_events=('event_time', 'count'), first_seen=('event_time', 'min'),
+            last_seen=('event_time', 'max'),
+            n_rows=('event_duration_sec', 'count'), dur_mean=('event_duration_sec', 'mean'),
+            dur_m2=('duration_dev2', 'sum'), peak_duration_sec=('event_duration_sec', 'max'),
+            **{col: (col, how) for col, how in IP_ATTRIBUTES.items()})
+        for col in FIRST_COLUMNS:
+            batch[f'{col}_time'] = rows['event_time'].where(rows[col].notna()).groupby(rows['src_ip'], sort=False).min()
+        if self.totals is None:
+            self.totals = batch
+        else:
+            # a groupby over the IPs of the batch, not over every IP seen so far
+            positions = self.totals.index.get_indexer(batch.index)
+            known = positions[positions >= 0]
+            frame = concat_categorical([self.totals.iloc[known].reset_index(), batch.reset_index()])
+            grouped = frame.groupby('src_ip', sort=False, observed=True)
+            merged = grouped.agg({col: how for col, how in TOTALS.items() if how != 'first'})
+            _, merged['dur_mean'], merged['dur_m2'] = merge_moments(
+                grouped.ngroup().to_numpy(), frame['n_rows'].to_numpy(dtype=float),
+                frame['dur_mean'].to_numpy(dtype=float), frame['dur_m2'].to_numpy(dtype=float), len(merged))
+            for col in FIRST_COLUMNS:
+                # the value seen earliest, missing values have no time and sort last
+                time_col = f'{col}_time'
+                earliest = frame.sort_values(time_col, kind='stable', na_position='last')
+                earliest = earliest.groupby('src_ip', sort=False, observed=True)
+                merged[col] = earliest[col].first()
+                merged[time_col] = earliest[time_col].min()
+            unchanged = np.ones(len(self.totals), dtype=bool)
+            unchanged[known] = False
+            self.totals = concat_categorical([self.totals[unchanged].reset_index(),
+                                              merged.reset_index()]).set_index('src_ip')
+        self.touched.update(batch.index)
+
+        for measure, col in DISTINCT_MEASURES.items():
+            pairs = rows[['src_ip', col]].dropna().drop_duplicates()
+            hashes = pd.util.hash_pandas_object(pairs, index=False).tolist()
+            seen = self.seen[measure]
+            new = np.fromiter((value not in seen for value in hashes), dtype=bool, count=len(hashes))
+            seen.update(compress(hashes, new))
+            add_counts(self.distinct[measure], pairs['src_ip'][new].value_counts())
+
+        for name, col in ORDERED_LISTS.items():
+            lists = self.lists[name]
+            first = rows.groupby(['src_ip', col], observed=True, sort=False)['event_time'].min()
+            for (ip, value), time in first.items():
+                values = lists.setdefault(ip, {})
+                if value not in values or time < values[value]:
+                    values[value] = time
+
+        times = rows[['src_ip', 'event_time']].drop_duplicates()
+        by_day = times.groupby([times['src_ip'], day_code(times['event_time'])]).size()
+        add_counts(self.day_counts, by_day)
+        for ip, day in by_day.index:
+            self.days.setdefault(ip, set()).add(int(day))
+        add_counts(self.hour_counts, times.groupby([times['src_ip'], times['event_time'].dt.hour]).size())
+        return self
+
+    def profiles(self, start_day, end_day):
+        """Per-IP profiles in the aggregate_data layout without the value lists."""
+        if self.totals is None:
+            return pd.DataFrame(columns=profile_columns(include_lists=False))
+        if self.last_profiles is None or self.last_days != (start_day, end_day):
+            profiles = self.profile_rows(self.totals.index, start_day, end_day)
+        else:
+            # the other rows are as they were, a new day range rebuilds them all
+            unchanged = self.last_profiles[~self.last_profiles['src_ip'].isin(self.touched)]
+            touched = self.profile_rows(pd.Index(list(self.touched)), start_day, end_day)
+            profiles = concat_categorical([unchanged, touched]).sort_values('src_ip', ignore_index=True)
+        self.last_profiles, self.last_days, self.touched = profiles, (start_day, end_day), set()
+        return profiles
+
+    def profile_rows(self, ips, start_day, end_day):
+        # profiles of `ips`, sorted by src_ip
+        ips = pd.Index(ips.sort_values(), name='src_ip')
+        df_ip = self.totals.reindex(ips)
+        df_ip['avg_duration_sec'] = df_ip['dur_mean']
+        df_ip['std_duration_sec'] = duration_std(df_ip['n_rows'], df_ip['dur_m2'])
+        for measure, counts in self.distinct.items():
+            df_ip[measure] = np.array([counts.get(ip, 0) for ip in ips], dtype=np.int64)
+        for name, lists in self.lists.items():
+            df_ip[name] = [np.asarray(sorted(lists[ip], key=lists[ip].get)) for ip in ips]
+        df_ip['n_apps'] = df_ip['app_list'].map(len)
+        df_ip['n_protocols'] = df_ip['protocol_list'].map(len)
+
+        n_days = end_day - start_day + 1
+        by_day = np.zeros((len(ips), n_days), dtype=np.int64)
+        by_dayofweek = np.zeros((len(ips), 7), dtype=np.int64)
+        for row, ip in enumerate(ips):
+            for day in self.days[ip]:
+                count = self.day_counts[ip, day]
+                by_dayofweek[row, day_of_week(day)] += count
+                if start_day <= day <= end_day:
+                    by_day[row, day - start_day] = count
+        df_ip['age_in_days'] = [len(self.days[ip]) for ip in ips]
+        by_hour = [[self.hour_counts.get((ip, hour), 0) for hour in range(24)] for ip in ips]
+        df_ip['countby_day'] = by_day.tolist()
+        df_ip['countby_dayofweek'] = by_dayofweek.tolist()
+        df_ip['countby_hourofday'] = by_hour
+        return df_ip.reset_index()[profile_columns(include_lists=False)]
+
+class LiveSnapshot(NamedTuple):
+    version: int
+    # time-sorted (events, EventIndex) chunks, shared with earlier snapshots
+    chunks: tuple
+    n_events: int
+    rollup: Rollup
+    # per-IP profiles of the default filters
+    profiles: pd.DataFrame
+    n_files: int
+    # time.time() of the last poll that found new events
+    updated: float
+
+def append_events(events, n_timed, new):
+    """`events` followed by the `new` rows, keeping rows without an event time last.
+
+    `n_timed` rows of `events` have an event time and `new` is time-sorted. The
+    result is only sorted again when a late file holds events older than the
+    latest ones.
+    """
+    n_new = int(new['event_time'].notna().sum())
+    df = concat_categorical([events.iloc[:n_timed], new.iloc[:n_new], events.iloc[n_timed:], new.iloc[n_new:]])
+    if n_timed and n_new and new['event_time'].iloc[0] < events['event_time'].iloc[n_timed - 1]:
+        df = df.sort_values('event_time', kind='stable', ignore_index=True)
+    return df
+
+def append_chunk(chunks, new):
+    """`chunks` followed by the time-sorted `new` events as a chunk of their own.
+
+    The newest chunks are merged while the last holds at least half as many
+    events as the one before it. Chunk sizes then grow geometrically, so there
+    are O(log n) chunks and every event is copied O(log n) times over all
+    appends rather than once per poll.
+    """
+    chunks = list(chunks) + [(new, build_event_index(new))]
+    while len(chunks) > 1 and 2 * len(chunks[-1][0]) >= len(chunks[-2][0]):
+        newer, _ = chunks.pop()
+        older, older_index = chunks[-1]
+        merged = append_events(older, len(older_index.days), newer)
+        chunks[-1] = (merged, build_event_index(merged))
+    return tuple(chunks)
+
+class LiveTail:
+    """Events, rollup and running aggregates of a window that grows as hourly files land.
+
+    Polls are serialised by `lock`. Readers take `snapshot`, whose frames later
+    polls replace rather than modify. `credentials` is updated in place, so
+    read it under `lock`. Files that fail to ingest are kept in `failed` and
+    not fetched again, the fetch has already retried them.
+    """
+
+    def __init__(self, fs, prefix, cache_dir, start, end, topk_capacity=None, sketch_precision=None):
+        self.fs = fs
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+        self.start = start
+        self.end = end
+        self.sketch_precision = sketch_precision
+        self.lock = threading.Lock()
+        self.paths = set()
+        self.failed = set()
+        # time.monotonic() of the last poll that listed the prefix
+        self.polled = None
+        self.ip_state = IPState()
+        self.credentials = CredentialStats(capacity=topk_capacity)
+        self.snapshot = None
+
+    def poll(self, min_interval=0):
+        """Ingest the event files that appeared since the last poll, returns the number of new events.
+
+        Returns 0 without listing the prefix when the last poll was less than
+        `min_interval` seconds ago or another poll is still running.
+        """
+        if not self.lock.acquire(blocking=False):
+            return 0
+        try:
+            now = time.monotonic()
+            if self.polled is not None and now - self.polled < min_interval:
+                return 0
+            self.polled = now
+            event_files = list_event_files(self.fs, self.prefix, start=self.start, end=self.end)
+            new_paths = [path for path in event_files if path not in self.paths and path not in self.failed]
+            if not new_paths:
+                return 0
+            sync_event_store(self.fs, new_paths, self.cache_dir)
+            # files that failed to ingest are not in the manifest
+            manifest = read_manifest(self.cache_dir)
+            self.failed.update(path for path in new_paths if path not in manifest)
+            new_paths = [path for path in new_paths if path in manifest]
+            self.paths.update(new_paths)
+            new = concat_categorical(list(iter_event_store(self.cache_dir, new_paths)))
+            if new.empty:
+                return 0
+            self.append(new)
+            return len(new)
+        finally:
+            self.lock.release()
+
+    def append(self, new):
+        snapshot = self.snapshot
+        # partitions are sorted each, rows without an event time end up last
+        new = new.sort_values('event_time', kind='stable', ignore_index=True)
+        if snapshot is None:
+            chunks = append_chunk((), new)
+            rollup = build_rollup(new, sketch_precision=self.sketch_precision)
+        else:
+            chunks = append_chunk(snapshot.chunks, new)
+            rollup = extend_rollup(snapshot.rollup, new)
+        self.ip_state.update(new)
+        self.credentials.update(new)
+        days = [index.days for _, index in chunks if len(index.days)]
+        profiles = None
+        if days:
+            profiles = self.ip_state.profiles(min(int(d[0]) for d in days), max(int(d[-1]) for d in days))
+        self.snapshot = LiveSnapshot(version=0 if snapshot is None else snapshot.version + 1,
+                                     chunks=chunks, n_events=sum(len(df) for df, _ in chunks), rollup=rollup,
+                                     profiles=profiles, n_files=len(self.paths), updated=time.time())
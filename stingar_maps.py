@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+# Server-side spatial binning of map points into web mercator quadtree tiles.
+# A tile of level z is 1/2^z of the world wide, so at map zoom z a tile of
+# level z + CELL_LEVEL_OFFSET is 256 / 2^CELL_LEVEL_OFFSET = 32 pixels wide.
+CELL_LEVEL_OFFSET = 3
+MAX_CELL_LEVEL = 12
+# upper bound on the cells sent to the browser per layer
+MAX_MAP_CELLS = 4000
+# filtered frames up to this many points are drawn point by point
+MIN_BINNED_POINTS = 2000
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+def tile_coords(latitude, longitude, level):
+    """Return the (x, y) web mercator tile indices of each point at `level`."""
+    n = 2 ** level
+    lat = np.radians(np.clip(latitude, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    x = np.floor((longitude + 180) / 360 * n)
+    y = np.floor((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+def cell_level_for_zoom(latitude, longitude, zoom, max_cells=MAX_MAP_CELLS):
+    """Finest tile level for `zoom` whose number of occupied cells stays within `max_cells`."""
+    level = min(int(zoom) + CELL_LEVEL_OFFSET, MAX_CELL_LEVEL)
+    x, y = tile_coords(latitude, longitude, level)
+    # parent tiles are found by shifting, so coarser levels need no new projection
+    while level > 0 and len(np.unique((y << level) | x)) > max_cells:
+        level -= 1
+        x, y = x >> 1, y >> 1
+    return level
+
+def bin_points(df, level, weight, measures):
+    """Aggregate the points of `df` into the quadtree tiles of `level`.
+
+    Each cell sits at the `weight`-weighted centroid of its points, carries the
+    named aggregations in `measures` and keeps the remaining columns of its
+    heaviest point, e.g. the city to show in a tooltip.
+    """
+    latitude = df['latitude'].to_numpy(dtype=float)
+    longitude = df['longitude'].to_numpy(dtype=float)
+    x, y = tile_coords(latitude, longitude, level)
+    weights = df[weight].to_numpy(dtype=float)
+    points = df.assign(cell=(y << level) | x,
+                       weighted_latitude=latitude * weights,
+                       weighted_longitude=longitude * weights)
+    # heaviest point first, so 'first' picks its attributes
+    points = points.iloc[np.argsort(-weights, kind='stable')]
+    attributes = {col: (col, 'first') for col in df.columns if col not in ('latitude', 'longitude')}
+    cells = points.groupby('cell', sort=False).agg(**{**attributes, **measures},
+                                                   weighted_latitude=('weighted_latitude', 'sum'),
+                                                   weighted_longitude=('weighted_longitude', 'sum'),
+                                                   weight_sum=(weight, 'sum'),
+                                                   n_points=(weight, 'size'))
+    cells['latitude'] = cells['weighted_latitude'] / cells['weight_sum']
+    cells['longitude'] = cells['weighted_longitude'] / cells['weight_sum']
+    cells = cells.drop(columns=['weighted_latitude', 'weighted_longitude', 'weight_sum'])
+    return cells.reset_index(drop=True)
+
+def points_for_zoom(df, zoom, weight, measures, max_cells=MAX_MAP_CELLS, min_binned=MIN_BINNED_POINTS):
+    """Points of `df` to draw at `zoom`: the points themselves when few remain,
+    otherwise at most `max_cells` binned cells (with an n_points column)."""
+    if len(df) <= min_binned:
+        return df
+    # points without coordinates are not drawn either way
+    df = df[df['latitude'].notna() & df['longitude'].notna()]
+    level = cell_level_for_zoom(df['latitude'].to_numpy(dtype=float),
+                                df['longitude'].to_numpy(dtype=float), zoom, max_cells)
+    return bin_points(df, level, weight, measures)
+
+# Map styling: sizes and colour ramps computed as arrays and emitted as RGB
+# channel columns, read by the layers as "[fill_r, fill_g, fill_b]".
+COLOUR_RANGE = np.array([[255,255,178],[254,217,118],[254,178,76],[253,141,60],[240,59,32],[189,0,38]],
+                        dtype=np.uint8)
+# colour used when a ramp has no range (a single value) or a value is missing
+DEFAULT_COLOUR_INDEX = 1
+RADIUS_UNIT = 100000 # in meters
+RADIUS_SCALE = 2
+
+def log_sizes(values, unit):
+    """Scale log1p(values) by their range into `unit`s; every size is `unit` when the range is zero."""
+    logs = np.log1p(np.asarray(values, dtype=float))
+    span = np.nanmax(logs) - np.nanmin(logs) if len(logs) else 0
+    if not span > 0:
+        return np.full(len(logs), float(unit))
+    return np.nan_to_num(logs / span * unit, nan=1)
+
+def colour_channels(values, colours=COLOUR_RANGE):
+    """Map log1p(values) linearly onto the colour ramp, returning the (r, g, b) channel arrays."""
+    logs = np.log1p(np.asarray(values, dtype=float))
+    index = np.full(len(logs), DEFAULT_COLOUR_INDEX, dtype=np.intp)
+    if len(logs):
+        lo, hi = np.nanmin(logs), np.nanmax(logs)
+        if hi > lo:
+            scaled = (logs - lo) / (hi - lo) * (len(colours) - 1)
+            valid = ~np.isnan(scaled)
+            index[valid] = scaled[valid].astype(np.intp)
+    rgb = colours[index]
+    return rgb[:, 0], rgb[:, 1], rgb[:, 2]
+
+def style_ip_points(df):
+    """Bubble size from the total events and colour from the peak duration of each IP."""
+    fill_r, fill_g, fill_b = colour_channels(df['peak_duration_sec'])
+    return df.assign(norm_size=log_sizes(df['total_events'], RADIUS_UNIT * RADIUS_SCALE),
+                     fill_r=fill_r, fill_g=fill_g, fill_b=fill_b)
+
+def style_city_columns(df):
+    """Column colour from the event count of each location."""
+    fill_r, fill_g, fill_b = colour_channels(df['count'])
+    return df.assign(fill_r=fill_r, fill_g=fill_g, fill_b=fill_b)
+
+def map_globe_color(app):
+    """Return green for cowrie and blue for the other honeypots"""
+    if app.lower() in ("cowrie"):
+        return [0, 255, 0]
+    return [0, 0, 255]
+
+def style_globe_columns(df):
+    """Column colour by honeypot type, looked up once per category."""
+    apps = pd.Categorical(df['app'])
+    palette = np.array([map_globe_color(str(app)) for app in apps.categories] + [[0, 0, 255]], dtype=np.uint8)
+    # missing apps (code -1) take the last palette entry
+    rgb = palette[apps.codes]
+    return df.assign(fill_r=rgb[:, 0], fill_g=rgb[:, 1], fill_b=rgb[:, 2])
+
+# all arcs of the globe view end at the sensors in North Carolina
+GLOBE_ORIGIN = [-81.0403481, 35.4310715]
+IP_MAP_COLUMNS = ['src_ip', 'longitude', 'latitude', 'total_events', 'peak_duration_sec',
+                  'city', 'country', 'asn_org', 'asn', 'hostname']
+# how binned cells of the IP and city maps combine their points
+IP_CELL_MEASURES = {'total_events': ('total_events', 'sum'),
+                    'peak_duration_sec': ('peak_duration_sec', 'max')}
+CITY_CELL_MEASURES = {'count': ('count', 'sum')}
+
+def map_frames(events_df, ip_df):
+    """Build the frames drawn by the three map tabs from the filtered events and IP profiles."""
+    ip_df_plot = ip_df[IP_MAP_COLUMNS]
+    events_by_city_df = events_df.groupby(['latitude', 'longitude']).agg({
+                                                        'city':[('city', 'first')],
+                                                        'country':[('country', 'first')],
+                                                        'event_time': [('count', 'count')]}).reset_index()
+    events_by_city_df.columns = ['latitude', 'longitude'] + events_by_city_df.columns.get_level_values(1)[2:].to_list()
+    globe_df = events_df.groupby(['country', 'app'], observed=True).agg({'latitude':[('latitude', 'mean')],
+                                                        'longitude':[('longitude', 'mean')],
+                                                        'event_time': [('count', 'count')]}).reset_index()
+    globe_df.columns = ['country', 'app'] + globe_df.columns.get_level_values(1)[2:].to_list()
+    globe_df['origin'] = [GLOBE_ORIGIN] * len(globe_df)
+    return ip_df_plot, events_by_city_df, globe_df
@@ -0,0 +1,307 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from stingar_data import (HISTOGRAM_COLUMNS, IP_ATTRIBUTES, LIST_COLUMNS, aggregate_data, concat_categorical,
+                          ip_histograms, profile_columns)
+from stingar_hll import HLL_PRECISION, build_sketches, hll_estimate
+from stingar_ips import in_networks
+
+# Hourly rollup of the events keyed by (ip, day, hour, app, protocol, duration bucket).
+# Sidebar filters are answered by re-aggregating these cells instead of the raw rows.
+
+# Measures that are not additive over cells and still come from the raw rows
+RAW_MEASURES = {'src_port': [('n_src_ports', 'nunique')],
+                'sensor_uuid': [('n_sensors', 'nunique')],
+                'hp_data_session': [('n_sessions', 'nunique')],
+                'hp_data_commands': [('command_list', 'unique')],
+                'username': [('username_list', 'unique')],
+                'password': [('password_list', 'unique')]}
+
+# Distinct counts that can come from HyperLogLog sketches instead of the raw rows
+SKETCH_MEASURES = {'n_src_ports': 'src_port', 'n_sensors': 'sensor_uuid', 'n_sessions': 'hp_data_session'}
+SKETCH_KEYS = ['ip', 'day', 'app', 'protocol']
+
+class Rollup(NamedTuple):
+    cells: pd.DataFrame
+    ips: pd.DataFrame
+    duration_edges: np.ndarray
+    # {measure: sparse sketch table keyed by SKETCH_KEYS}, None unless requested
+    sketches: dict = None
+    sketch_precision: int = HLL_PRECISION
+
+def duration_bucket_edges(durations, n_buckets=12):
+    """Pick about `n_buckets` log-spaced bucket edges for the event durations, all of them observed values."""
+    values = np.unique(durations.dropna().to_numpy())
+    if len(values) == 0:
+        return np.array([])
+    positive = values[values > 0]
+    targets = np.geomspace(positive[0], positive[-1], n_buckets) if len(positive) else np.array([])
+    # each target snaps to the first observed duration at or above it
+    snapped = values[np.minimum(np.searchsorted(values, targets), len(values) - 1)]
+    return np.unique(np.concatenate([values[:1], snapped, values[-1:]]))
+
+def duration_buckets(durations, edges):
+    """Assign each duration to a bucket, -1 for missing durations.
+
+    Every edge is a bucket of its own (even codes) and the open interval between
+    two edges another (odd codes), so `between(edges[i], edges[j])` is exactly
+    the buckets 2*i..2*j.
+    """
+    values = durations.to_numpy(dtype=float)
+    pos = np.searchsorted(edges, values, side='left')
+    exact = (pos < len(edges)) & (edges[np.minimum(pos, len(edges) - 1)] == values)
+    buckets = np.where(exact, 2 * pos, 2 * pos - 1)
+    return np.where(np.isnan(values), -1, buckets).astype(np.int16)
+
+def duration_bucket_range(edges, start_duration, end_duration):
+    """Return the bucket range for a duration filter, or None if a bound is not an edge."""
+    lo, hi = np.searchsorted(edges, [start_duration, end_duration])
+    if lo >= len(edges) or hi >= len(edges) or edges[lo] != start_duration or edges[hi] != end_duration:
+        return None
+    return 2 * lo, 2 * hi
+
+def merge_moments(groups, n, mean, m2, n_groups):
+    """Count, mean and sum of squared deviations (M2) of the `groups` of partial moments.
+
+    Chan's parallel formula: the M2 of a union is the M2 of its parts plus
+    n_i * (mean_i - mean)**2 of each part, which does not cancel the way
+    sum(x**2) - sum(x)**2 / n does when the spread is small next to the mean.
+    """
+    total = np.bincount(groups, weights=n, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        merged_mean = np.bincount(groups, weights=n * mean, minlength=n_groups) / total
+    deviations = np.where(n > 0, mean - merged_mean[groups], 0)
+    m2 = np.bincount(groups, weights=m2 + n * deviations ** 2, minlength=n_groups)
+    return total, merged_mean, m2
+
+def duration_std(n, m2):
+    # sample standard deviation, NaN below two durations
+    n, m2 = np.asarray(n, dtype=float), np.asarray(m2, dtype=float)
+    return np.where(n > 1, np.sqrt(m2 / np.maximum(n - 1, 1)), np.nan)
+
+def rollup_cells(df, ip_codes, edges):
+    """Cells of the rows of `df` with an IP code and a duration, with those rows and their mask."""
+    events = pd.DataFrame({'ip': ip_codes.astype(np.int32),
+                           'day': df['day'],
+                           'hour': df['hour'],
+                           'app': df['app'],
+                           'protocol': df['protocol'],
+                           'dur_bucket': duration_buckets(df['event_duration_sec'], edges),
+                           'event_time': df['event_time'],
+                           'duration': df['event_duration_sec']})
+    # rows without an IP, event time or duration never pass the sidebar filters
+    keep = ((events['ip'] >= 0) & (events['dur_bucket'] >= 0) & events['event_time'].notna()).to_numpy()
+    events = events[keep].astype({'day': np.int32, 'hour': np.int8})
+    # rows without an app or protocol stay in cells of their own, selected by None as in filter_events
+    grouped = events.groupby(['ip', 'day', 'hour', 'app', 'protocol', 'dur_bucket'], observed=True, sort=False,
+                             dropna=False)
+    cells = grouped.agg(count=('event_time', 'count'),
+                        n_rows=('duration', 'size'),
+                        dur_mean=('duration', 'mean'),
+                        dur_max=('duration', 'max'),
+                        first_seen=('event_time', 'min'),
+                        last_seen=('event_time', 'max'))
+    # squared deviations from the mean of each cell, merged across cells by merge_moments
+    cell_codes = grouped.ngroup().to_numpy()
+    deviations = events['duration'].to_numpy(dtype=float) - cells['dur_mean'].to_numpy()[cell_codes]
+    cells['dur_m2'] = np.bincount(cell_codes, weights=deviations ** 2, minlength=len(cells))
+    return cells.reset_index(), events, keep
+
+def rollup_sketches(df, events, keep, sketch_precision):
+    keys = events[SKETCH_KEYS]
+    return {measure: build_sketches(keys, df[col][keep], sketch_precision)
+            for measure, col in SKETCH_MEASURES.items()}
+
+def build_rollup(df, n_buckets=12, sketch_precision=None):
+    """Roll the cleaned events up into hourly cells with additive measures.
+
+    With a `sketch_precision`, also keep HyperLogLog sketches of the
+    SKETCH_MEASURES per (ip, day, app, protocol).
+    """
+    ip_codes, ips = pd.factorize(df['src_ip'], sort=True)
+    edges = duration_bucket_edges(df['event_duration_sec'], n_buckets)
+    cells, events, keep = rollup_cells(df, ip_codes, edges)
+
+    # geo and ASN attributes are taken once per IP over the whole loaded window
+    ip_attributes = df.groupby(ip_codes, sort=True).agg(IP_ATTRIBUTES)
+    ip_attributes = ip_attributes.loc[ip_attributes.index >= 0]
+    ip_attributes.insert(0, 'src_ip', ips)
+
+    sketches = None
+    if sketch_precision is not None:
+        sketches = rollup_sketches(df, events, keep, sketch_precision)
+    return Rollup(cells=cells, ips=ip_attributes.reset_index(drop=True), duration_edges=edges,
+                  sketches=sketches, sketch_precision=sketch_precision or HLL_PRECISION)
+
+def extend_rollup(rollup, df):
+    """Add newly loaded events to a rollup, at a cost proportional to their rows.
+
+    New IPs take the next codes, so `ips` is in order of first appearance from
+    then on. The bucket edges are kept and only widened when new durations fall
+    outside them, which leaves the existing cells valid.
+    """
+    edges, cells = rollup.duration_edges, rollup.cells
+    durations = df['event_duration_sec'].dropna()
+    if len(edges) == 0:
+        edges = duration_bucket_edges(durations)
+    elif len(durations):
+        if durations.min() < edges[0]:
+            # a new first edge moves every bucket up by one edge and one interval
+            edges = np.insert(edges, 0, durations.min())
+            cells = cells.assign(dur_bucket=(cells['dur_bucket'] + 2).astype(np.int16))
+        if durations.max() > edges[-1]:
+            edges = np.append(edges, durations.max())
+
+    ips = rollup.ips
+    ip_codes = pd.Index(ips['src_ip']).get_indexer(df['src_ip'])
+    unknown = (ip_codes < 0) & df['src_ip'].notna().to_numpy()
+    if unknown.any():
+        new_ips = pd.unique(df['src_ip'][unknown])
+        new_codes = pd.Index(new_ips).get_indexer(df['src_ip'][unknown])
+        ip_codes[unknown] = len(ips) + new_codes
+        ip_attributes = df[unknown].groupby(new_codes, sort=True).agg(IP_ATTRIBUTES)
+        ip_attributes.insert(0, 'src_ip', new_ips)
+        ips = concat_categorical([ips, ip_attributes.reset_index(drop=True)])
+
+    new_cells, events, keep = rollup_cells(df, ip_codes, edges)
+    sketches = rollup.sketches
+    if sketches is not None:
+        new_sketches = rollup_sketches(df, events, keep, rollup.sketch_precision)
+        sketches = {measure: concat_categorical([sketches[measure], new_sketches[measure]]) for measure in sketches}
+    return rollup._replace(cells=concat_categorical([cells, new_cells]), ips=ips, duration_edges=edges,
+                           sketches=sketches)
+
+def split_lists(cells, column, order_by):
+    # per IP, the distinct values of `column` in order of first appearance
+    first = cells.groupby(['ip', column], observed=True, dropna=False)[order_by].min().reset_index()
+    first = first.sort_values(['ip', order_by], kind='stable')
+    if first.empty:
+        return []
+    values = first[column].astype(object).to_numpy()
+    boundaries = np.flatnonzero(np.diff(first['ip'].to_numpy())) + 1
+    return [np.asarray(group) for group in np.split(values, boundaries)]
+
+def aggregate_rollup(rollup, start_day, end_day, apps, protocols, bucket_range, networks=None):
+    """Build the additive part of the per-IP profile from the rollup cells."""
+    cells = rollup.cells
+    mask = cells['day'].between(start_day, end_day)
+    mask &= cells['app'].isin(apps)
+    mask &= cells['protocol'].isin(protocols)
+    mask &= cells['dur_bucket'].between(*bucket_range)
+    if networks:
+        ips = rollup.ips
+        mask &= cells['ip'].isin(np.flatnonzero(in_networks(ips['ip_hi'], ips['ip_lo'], networks)))
+    cells = cells[mask]
+
+    df_ip = cells.groupby('ip', sort=True).agg(total_events=('count', 'sum'),
+                                               first_seen=('first_seen', 'min'),
+                                               last_seen=('last_seen', 'max'),
+                                               n_rows=('n_rows', 'sum'),
+                                               peak_duration_sec=('dur_max', 'max'),
+                                               age_in_days=('day', 'nunique'),
+                                               n_apps=('app', 'nunique'),
+                                               n_protocols=('protocol', 'nunique'))
+    rows = np.searchsorted(df_ip.index.to_numpy(), cells['ip'].to_numpy())
+    n, mean, m2 = merge_moments(rows, cells['n_rows'].to_numpy(dtype=float), cells['dur_mean'].to_numpy(),
+                                cells['dur_m2'].to_numpy(), len(df_ip))
+    df_ip['avg_duration_sec'] = mean
+    df_ip['std_duration_sec'] = duration_std(n, m2)
+    df_ip['app_list'] = split_lists(cells, 'app', 'first_seen')
+    df_ip['protocol_list'] = split_lists(cells, 'protocol', 'first_seen')
+    df_ip = rollup.ips.iloc[df_ip.index].reset_index(drop=True).join(df_ip.reset_index(drop=True))
+    return df_ip.drop(columns='n_rows')
+
+def sketch_rows(rollup, measure, start_day, end_day, apps, protocols, ip_codes=None):
+    sketch = rollup.sketches[measure]
+    mask = sketch['day'].between(start_day, end_day)
+    mask &= sketch['app'].isin(apps)
+    mask &= sketch['protocol'].isin(protocols)
+    if ip_codes is not None:
+        mask &= sketch['ip'].isin(ip_codes)
+    return sketch[mask]
+
+def sketch_distinct_counts(rollup, start_day, end_day, apps, protocols):
+    """Per-IP estimates of the SKETCH_MEASURES over the selection, from merged sketches."""
+    counts = {}
+    for measure in SKETCH_MEASURES:
+        rows = sketch_rows(rollup, measure, start_day, end_day, apps, protocols)
+        counts[measure] = hll_estimate(rows['ip'], rows['register'], rows['rank'], len(rollup.ips),
+                                       rollup.sketch_precision)
+    df_ip = pd.DataFrame(counts)
+    df_ip.insert(0, 'src_ip', rollup.ips['src_ip'])
+    return df_ip
+
+def sketch_total(rollup, measure, start_day, end_day, apps, protocols, src_ips=None):
+    """Estimate of `measure` over all selected IPs, the union of their sketches."""
+    ip_codes = None
+    if src_ips is not None:
+        ip_codes = pd.Index(rollup.ips['src_ip']).get_indexer(src_ips)
+    rows = sketch_rows(rollup, measure, start_day, end_day, apps, protocols, ip_codes)
+    return hll_estimate(np.zeros(len(rows), dtype=np.int64), rows['register'], rows['rank'], 1,
+                        rollup.sketch_precision)[0]
+
+def sketches_apply(rollup, bucket_range):
+    # sketches are not split by duration, so they only serve the full duration range
+    return rollup.sketches is not None and bucket_range == (0, 2 * (len(rollup.duration_edges) - 1))
+
+def distinct_counts(ip_codes, values, n_ips):
+    # distinct non-missing values per IP code, from the unique (ip, value) code pairs
+    codes, uniques = pd.factorize(values)
+    keep = (ip_codes >= 0) & (codes >= 0)
+    pairs = pd.unique(ip_codes[keep].astype(np.int64) * len(uniques) + codes[keep])
+    return np.bincount(pairs // max(len(uniques), 1), minlength=n_ips)
+
+def aggregate_raw_measures(df, include_lists=True, include_distinct=True):
+    """Per-IP measures the rollup cannot serve, computed from the filtered events."""
+    ip_codes, ips = pd.factorize(df['src_ip'], sort=True)
+    df_ip = pd.DataFrame({'src_ip': ips})
+    if include_distinct:
+        for col, aggregations in RAW_MEASURES.items():
+            if col not in LIST_COLUMNS:
+                df_ip[aggregations[0][0]] = distinct_counts(ip_codes, df[col], len(ips))
+    if include_lists:
+        lists = df.groupby(ip_codes, sort=True).agg({col: RAW_MEASURES[col] for col in LIST_COLUMNS})
+        lists = lists.loc[lists.index >= 0]
+        for col in LIST_COLUMNS:
+            df_ip[RAW_MEASURES[col][0][0]] = lists[col].iloc[:, 0].to_numpy()
+    return df_ip
+
+def aggregate_filtered(rollup, df, start_day, end_day, apps, protocols, start_duration, end_duration,
+                       include_lists=True, approximate=False, networks=None, include_histograms=True):
+    """Per-IP profile for the sidebar filters, served from the rollup where possible.
+
+    `df` holds the raw events that pass the same filters. It is fully regrouped
+    only when the duration bounds do not fall on bucket edges. With
+    `approximate`, distinct ports, sensors and sessions are HyperLogLog
+    estimates when the rollup has sketches and the full duration range is selected.
+    `networks` restricts the IPs as in filter_events. `include_lists` and
+    `include_histograms` are as in aggregate_data, both are built from `df`.
+    """
+    bucket_range = duration_bucket_range(rollup.duration_edges, start_duration, end_duration)
+    if bucket_range is None:
+        return aggregate_data(df, start_day, end_day, include_lists=include_lists,
+                              include_histograms=include_histograms)
+    try:
+        df_ip = aggregate_rollup(rollup, start_day, end_day, apps, protocols, bucket_range, networks)
+        if approximate and sketches_apply(rollup, bucket_range):
+            estimates = sketch_distinct_counts(rollup, start_day, end_day, apps, protocols)
+            df_ip = df_ip.merge(estimates.round().astype({measure: 'int64' for measure in SKETCH_MEASURES}),
+                                on='src_ip', how='left')
+            if include_lists:
+                df_ip = df_ip.merge(aggregate_raw_measures(df, include_lists, include_distinct=False),
+                                    on='src_ip', how='left')
+        else:
+            df_ip = df_ip.merge(aggregate_raw_measures(df, include_lists), on='src_ip', how='left')
+        if include_histograms:
+            # histograms count distinct event times, which cells cannot tell apart
+            # when one timestamp of an IP falls under two apps, protocols or buckets
+            ip_codes = pd.Index(df_ip['src_ip']).get_indexer(df['src_ip'])
+            histograms = ip_histograms(ip_codes, df['event_time'], len(df_ip), start_day, end_day)
+            for col, counts in zip(HISTOGRAM_COLUMNS, histograms):
+                df_ip[col] = counts.tolist()
+        return df_ip[profile_columns(include_lists, include_histograms)]
+    except Exception as e:
+        print(f"Error aggregating rollup: {e}")
+        return pd.DataFrame()
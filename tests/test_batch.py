@@ -0,0 +1,42 @@
+import sys
+
+from stingar_batch import (build_ip_profiles, default_filter, profile_metadata, read_ip_profiles,
+                           write_ip_profiles)
+from stingar_batch import main as batch_main
+from stingar_data import aggregate_data
+from stingar_synthetic import synthetic_events, write_event_files
+
+from profiles import assert_profiles_equal
+
+def test_sharded_profiles_round_trip(tmp_path):
+    events_df = synthetic_events(3000, days=3, seed=5)
+    filtered_df, start_day, end_day = default_filter(events_df)
+    expected = aggregate_data(filtered_df, start_day, end_day)
+
+    profiles = build_ip_profiles(filtered_df, start_day, end_day, max_workers=2, n_shards=3)
+    metadata = profile_metadata(events_df, start_day, end_day)
+    path = tmp_path / 'ip_profiles.parquet'
+    write_ip_profiles(profiles, path, metadata)
+    profiles, read_metadata = read_ip_profiles(path)
+
+    assert read_metadata == metadata
+    assert len(expected) > 0
+    assert_profiles_equal(profiles, expected)
+
+def test_batch_reads_one_prefix_of_a_shared_store(tmp_path, monkeypatch):
+    # hours of the same names under two prefixes, synced into one store
+    for name, rows, seed in [('a', 600, 1), ('b', 900, 2)]:
+        write_event_files(tmp_path / name, rows, days=1, seed=seed)
+    cache_dir, output = tmp_path / 'cache', tmp_path / 'ip_profiles.parquet'
+    window = ['--start', '2023-10-01', '--end', '2023-10-01', '--workers', '1', '--cache-dir', str(cache_dir),
+              '--output', str(output)]
+    for name in ['b', 'a']:
+        monkeypatch.setattr(sys, 'argv', ['stingar_batch.py', '--prefix', str(tmp_path / name)] + window)
+        batch_main()
+        assert read_ip_profiles(output)[1]['n_events'] == {'a': 600, 'b': 900}[name]
+
+    # without --prefix the store is read for the dashboard's prefix only
+    monkeypatch.setenv('STINGAR_EVENTS_PREFIX', str(tmp_path / 'b'))
+    monkeypatch.setattr(sys, 'argv', ['stingar_batch.py'] + window)
+    batch_main()
+    assert read_ip_profiles(output)[1]['n_events'] == 900
@@ -0,0 +1,45 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from stingar_credentials import CredentialStats, SpaceSaving
+
+def skewed_stream(n, seed=0):
+    # Zipf-distributed values, a few heavy hitters over a long tail
+    rng = np.random.default_rng(seed)
+    return pd.Series([f"user{rank}" for rank in rng.zipf(1.3, n)])
+
+def test_space_saving_top_k_matches_value_counts():
+    stream = skewed_stream(100_000)
+    capacity = 200
+    summary = SpaceSaving(capacity)
+    for start in range(0, len(stream), 1000):
+        summary.update(Counter(stream[start:start + 1000]))
+    exact = stream.value_counts()
+    top = summary.top(10)
+    assert [value for value, _, _ in top] == exact.index[:10].tolist()
+    # every counter is an overestimate by at most its error, which is at most n / capacity
+    for value, count in summary.counts.items():
+        error = summary.errors[value]
+        assert count - error <= exact.get(value, 0) <= count
+        assert error <= len(stream) / capacity
+    # every value more frequent than n / capacity keeps a counter
+    assert set(exact.index[exact > len(stream) / capacity]) <= set(summary.counts)
+    assert len(summary.counts) == capacity
+
+def test_credential_stats_top_k_matches_exact_counts():
+    usernames = skewed_stream(20_000, seed=1)
+    passwords = skewed_stream(20_000, seed=2).str.replace('user', 'pass')
+    df = pd.DataFrame({'username': "['" + usernames + "']", 'password': "['" + passwords + "']",
+                       'hp_data_commands': None})
+    exact, approximate = CredentialStats(), CredentialStats(capacity=100)
+    for start in range(0, len(df), 2500):
+        exact.update(df[start:start + 2500])
+        approximate.update(df[start:start + 2500])
+    for kind in ['username', 'password', 'credential']:
+        expected, top = exact.top(kind, 5), approximate.top(kind, 5)
+        assert top['value'].tolist() == expected['value'].tolist(), kind
+        assert (top['count'] - top['max_error'] <= expected['count']).all(), kind
+        assert (expected['count'] <= top['count']).all(), kind
+    assert exact.top('username', 5)['value'].tolist() == usernames.value_counts().index[:5].tolist()
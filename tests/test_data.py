@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from stingar_data import aggregate_data, day_label
+from stingar_synthetic import synthetic_events
+
+def reference_histograms(df, start_day, end_day):
+    # the original per-IP .apply over the distinct event times of each IP
+    days = pd.date_range(day_label(start_day), day_label(end_day), tz='UTC')
+    times = df.groupby('src_ip')['event_time'].unique()
+    return pd.DataFrame({
+        'countby_day': times.apply(lambda x: pd.DatetimeIndex(x).floor('D').value_counts()
+                                   .reindex(days, fill_value=0).tolist()),
+        'countby_dayofweek': times.apply(lambda x: pd.DatetimeIndex(x).dayofweek.value_counts()
+                                         .reindex(range(0, 7), fill_value=0).tolist()),
+        'countby_hourofday': times.apply(lambda x: pd.DatetimeIndex(x).hour.value_counts()
+                                         .reindex(range(0, 24), fill_value=0).tolist())})
+
+def histogram_events():
+    df = synthetic_events(600, days=4, n_ips=25, seed=3)
+    # repeated timestamps of an IP count once, events without a time not at all
+    repeats = df.iloc[::7]
+    missing = df.iloc[:3].copy()
+    missing.loc[:, ['event_time', 'day', 'hour']] = None
+    return pd.concat([df, repeats, missing], ignore_index=True)
+
+def test_histograms_match_reference():
+    df = histogram_events()
+    days = df['day'].dropna()
+    # a window narrower than the events, days outside it only count by weekday and hour
+    start_day, end_day = int(days.min()) + 1, int(days.max())
+    df_ip = aggregate_data(df, start_day, end_day, include_lists=False).set_index('src_ip')
+    expected = reference_histograms(df, start_day, end_day)
+    assert df_ip.index.equals(expected.index)
+    for col in expected.columns:
+        assert df_ip[col].tolist() == expected[col].tolist(), col
+
+def test_histograms_cover_the_window():
+    df = histogram_events()
+    days = df['day'].dropna()
+    start_day, end_day = int(days.min()), int(days.max())
+    df_ip = aggregate_data(df, start_day, end_day, include_lists=False)
+    assert all(len(counts) == end_day - start_day + 1 for counts in df_ip['countby_day'])
+    # every distinct event time of an IP is in exactly one day, weekday and hour
+    n_times = df.dropna(subset=['event_time']).groupby('src_ip')['event_time'].nunique()
+    for col in ['countby_day', 'countby_dayofweek', 'countby_hourofday']:
+        assert np.array_equal(df_ip[col].map(sum).to_numpy(), n_times.to_numpy()), col
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from stingar_data import build_event_index, concat_categorical, filter_event_chunks
+from stingar_synthetic import synthetic_events
+
+def with_missing_values(df, seed):
+    # some rows lose their app, protocol or event time, untimed rows sort last as in clean_events
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    df.loc[rng.random(len(df)) < 0.05, 'app'] = None
+    df.loc[rng.random(len(df)) < 0.05, 'protocol'] = None
+    df.loc[rng.random(len(df)) < 0.03, ['event_time', 'day', 'hour']] = None
+    return df.sort_values('event_time', kind='stable', ignore_index=True)
+
+@pytest.fixture(scope='module')
+def chunks():
+    df = synthetic_events(3000, days=4, seed=5)
+    df['row'] = np.arange(len(df))
+    # two chunks in time order, then a late one that overlaps both
+    late = df.iloc[::9]
+    df = df.drop(late.index)
+    half = len(df) // 2
+    frames = [with_missing_values(frame, seed) for seed, frame in enumerate([df.iloc[:half], df.iloc[half:], late])]
+    return [(frame, build_event_index(frame)) for frame in frames]
+
+def baseline_rows(chunks, start_day, end_day, selections, start_duration, end_duration):
+    # the original boolean masks over all events, where a selected missing value keeps the rows without one
+    df = concat_categorical([frame for frame, _ in chunks])
+    mask = df['day'].between(start_day, end_day).fillna(False).to_numpy(dtype=bool)
+    for col, values in selections.items():
+        mask &= (df[col].isin([value for value in values if value is not None])
+                 | (df[col].isna() & (None in values))).to_numpy()
+    mask &= df['event_duration_sec'].between(start_duration, end_duration).to_numpy()
+    return df[mask].sort_values('event_time', kind='stable')['row'].tolist()
+
+def options(chunks, col):
+    return list(dict.fromkeys(value for _, index in chunks for value in index.bitmaps[col]))
+
+def selection(chunks, case):
+    days = np.concatenate([index.days for _, index in chunks])
+    start_day, end_day = int(days.min()), int(days.max())
+    apps, protocols = options(chunks, 'app'), options(chunks, 'protocol')
+    start_duration, end_duration = 0, np.inf
+    if case == 'days':
+        start_day, end_day = start_day + 1, end_day - 1
+    if case == 'without_missing':
+        apps, protocols = [app for app in apps if app is not None], [p for p in protocols if p is not None]
+    if case == 'only_missing':
+        apps = [None]
+    if case == 'subset':
+        apps, protocols = [apps[0], None], protocols[:2]
+        start_duration, end_duration = 1, 60
+    return start_day, end_day, {'app': apps, 'protocol': protocols}, start_duration, end_duration
+
+@pytest.mark.parametrize('case', ['default', 'days', 'without_missing', 'only_missing', 'subset'])
+def test_filter_event_chunks_match_boolean_masks(chunks, case):
+    args = selection(chunks, case)
+    expected = baseline_rows(chunks, *args)
+    assert filter_event_chunks(chunks, *args)['row'].tolist() == expected
+    assert len(expected) > 0
+
+def test_default_selection_keeps_missing_values(chunks):
+    assert None in options(chunks, 'app') and None in options(chunks, 'protocol')
+    filtered = filter_event_chunks(chunks, *selection(chunks, 'default'))
+    assert filtered['app'].isna().any() and filtered['protocol'].isna().any()
+    # only rows without an event time or duration fall outside the default selection
+    n_kept = sum(int((frame['event_time'].notna() & frame['event_duration_sec'].notna()).sum())
+                 for frame, _ in chunks)
+    assert len(filtered) == n_kept
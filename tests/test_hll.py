@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from stingar_hll import build_sketches, hll_error, hll_estimate
+
+def group_sketches(sizes, precision=10):
+    # group i holds sizes[i] distinct values, none of them shared with other groups
+    groups = np.repeat(np.arange(len(sizes)), sizes)
+    values = pd.Series([f"{group}-{i}" for group, size in enumerate(sizes) for i in range(size)])
+    return build_sketches(pd.DataFrame({'group': groups}), values, precision), groups, values
+
+def estimates(sketches, n_groups, precision=10):
+    return hll_estimate(sketches['group'], sketches['register'], sketches['rank'], n_groups, precision)
+
+def test_error_at_precision_10():
+    assert round(hll_error(10), 4) == 0.0325
+    sizes = np.full(300, 3000)
+    sketches, _, _ = group_sketches(sizes)
+    relative = estimates(sketches, len(sizes)) / sizes - 1
+    # the spread over many groups is the documented standard error
+    rms = np.sqrt(np.mean(relative ** 2))
+    assert 0.6 * hll_error(10) < rms < 1.4 * hll_error(10)
+    assert abs(relative.mean()) < hll_error(10) / 2
+    assert np.abs(relative).max() < 4 * hll_error(10)
+
+def test_linear_counting_is_near_exact_for_small_counts():
+    sizes = np.arange(1, 101)
+    sketches, _, _ = group_sketches(sizes)
+    counts = estimates(sketches, len(sizes))
+    assert np.array_equal(np.round(counts[:10]), sizes[:10])
+    assert np.sqrt(np.mean((counts / sizes - 1) ** 2)) < hll_error(10)
+
+def test_merged_sketches_estimate_the_union():
+    sizes = np.full(20, 2000)
+    whole, groups, values = group_sketches(sizes)
+    # sketches of two overlapping halves merge into the sketch of all values
+    keys = pd.DataFrame({'group': groups})
+    halves = pd.concat([build_sketches(keys[:30000], values[:30000]), build_sketches(keys[10000:], values[10000:])])
+    assert np.array_equal(estimates(halves, len(sizes)), estimates(whole, len(sizes)))
+    assert estimates(whole.iloc[:0], 3).tolist() == [0, 0, 0]
@@ -0,0 +1,88 @@
+import ipaddress
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from stingar_ips import build_ip_index, encode_ips, in_networks, network_rollup, network_rows, parse_networks, valid_ips
+
+ADDRESSES = ['0.0.0.0', '1.2.3.4', '1.2.3.200', '10.0.0.1', '127.255.255.255', '128.0.0.0', '203.0.113.9',
+             '255.255.255.255', '::ffff:10.0.0.1', '::ffff:203.0.113.10', '::', '::1', '2001:db8::1',
+             '2001:db8:0:1::7', '7fff:ffff:ffff:ffff:ffff:ffff:ffff:ffff', '8000::', 'fe80::1',
+             'ffff:ffff:ffff:ffff:ffff:ffff:ffff:fffe']
+INVALID = ['not-an-ip', '', '999.1.1.1', '1.2.3', None]
+NETWORKS = ['0.0.0.0/0', '::/0', '0.0.0.0/1', '128.0.0.0/1', '::/1', '8000::/1', '1.2.3.0/24', '10.0.0.1/32',
+            '1.2.3.4', '::/128', '::1/128', '2001:db8::/32', '::ffff:0:0/96', '::ffff:203.0.113.0/120']
+
+def addresses():
+    rng = np.random.default_rng(0)
+    values = ADDRESSES + INVALID
+    values += [str(ipaddress.IPv4Address(int(n))) for n in rng.integers(0, 2 ** 32, 200, dtype=np.uint64)]
+    values += [str(ipaddress.IPv6Address(int(hi) << 64 | int(lo)))
+               for hi, lo in rng.integers(0, 2 ** 63, (200, 2), dtype=np.uint64)]
+    return pd.Series(values, dtype=object)
+
+def reference_forms(text):
+    # IPv4 addresses and IPv4-mapped IPv6 addresses are the same source in either form
+    try:
+        address = ipaddress.ip_address(text)
+    except ValueError:
+        return None, None
+    if address.version == 4:
+        return address, ipaddress.IPv6Address(f'::ffff:{address}')
+    return address.ipv4_mapped, address
+
+def reference_in(text, network):
+    v4, v6 = reference_forms(text)
+    if v6 is None:
+        return False
+    if network.version == 4:
+        return v4 is not None and v4 in network
+    return v6 in network
+
+def test_encode_ips_match_ipaddress():
+    values = addresses()
+    hi, lo = encode_ips(values)
+    valid = valid_ips(hi, lo)
+    for text, h, l, ok in zip(values, hi, lo, valid):
+        _, v6 = reference_forms(text)
+        assert ok == (v6 is not None), text
+        if ok:
+            assert (int(h) << 64 | int(l)) == int(v6), text
+
+@pytest.mark.parametrize('block', NETWORKS)
+def test_network_matches_match_ipaddress(block):
+    values = addresses()
+    hi, lo = encode_ips(values)
+    network = ipaddress.ip_network(block, strict=False)
+    expected = np.array([reference_in(text, network) for text in values])
+    networks = parse_networks(block)
+    assert np.array_equal(in_networks(hi, lo, networks), expected)
+    assert np.array_equal(network_rows(build_ip_index(hi, lo), networks), expected)
+    # rows start..end only
+    assert np.array_equal(network_rows(build_ip_index(hi, lo), networks, 5, 300), expected[5:300])
+
+def test_invalid_addresses_match_no_network():
+    hi, lo = encode_ips(pd.Series(INVALID, dtype=object))
+    networks = parse_networks(' '.join(NETWORKS))
+    assert not valid_ips(hi, lo).any()
+    assert not in_networks(hi, lo, networks).any()
+    assert not network_rows(build_ip_index(hi, lo), networks).any()
+
+def test_network_rollup_matches_ipaddress():
+    values = addresses().drop_duplicates().dropna()
+    hi, lo = encode_ips(values)
+    ip_df = pd.DataFrame({'src_ip': values.to_numpy(), 'ip_hi': hi, 'ip_lo': lo, 'total_events': 1,
+                          'first_seen': pd.Timestamp('2023-10-01', tz='UTC'),
+                          'last_seen': pd.Timestamp('2023-10-02', tz='UTC'), 'peak_duration_sec': 1.0,
+                          'asn': 1, 'asn_org': 'Org', 'country': 'US'})
+    expected = Counter()
+    for text in values:
+        v4, v6 = reference_forms(text)
+        if v4 is not None:
+            expected[str(ipaddress.ip_network(f'{v4}/24', strict=False))] += 1
+        elif v6 is not None:
+            expected[str(ipaddress.ip_network(f'{v6}/48', strict=False))] += 1
+    networks = network_rollup(ip_df, 24)
+    assert dict(zip(networks['network'], networks['n_ips'])) == expected
@@ -0,0 +1,55 @@
+import shutil
+from datetime import datetime
+
+import fsspec
+import pandas as pd
+
+from stingar_batch import default_filter
+from stingar_data import aggregate_data
+from stingar_live import LiveTail
+from stingar_store import read_event_store
+from stingar_synthetic import write_event_files
+
+from profiles import assert_profiles_equal
+
+def test_live_tail_matches_aggregate_data(tmp_path):
+    source, prefix, cache_dir = tmp_path / 'source', tmp_path / 'events', tmp_path / 'cache'
+    paths = sorted(write_event_files(source, 3000, days=2, seed=7))
+    prefix.mkdir()
+    tail = LiveTail(fsspec.filesystem('file'), str(prefix), str(cache_dir),
+                    datetime(2023, 10, 1), datetime(2023, 10, 3))
+    assert tail.poll() == 0 and tail.snapshot is None
+
+    # one hour lands after newer ones, another is not a readable export
+    late, broken = paths[5], paths[20]
+    on_time = [path for path in paths if path not in (late, broken)]
+    batches = [on_time[:10], on_time[10:25] + [broken], on_time[25:] + [late]]
+    for batch in batches:
+        for path in batch:
+            if path == broken:
+                (prefix / source.joinpath(path).name).write_text('event_time,src_ip\n"unterminated\n')
+            elif path == late:
+                # reverse DNS and geo lookups changed, so the late hour holds the earliest values of its IPs
+                raw = pd.read_csv(path)
+                raw = raw.assign(hostname='late.example', asn_org='Late Org', city='Late City', country='ZZ')
+                raw.to_csv(prefix / source.joinpath(path).name, index=False)
+            else:
+                shutil.copy(path, prefix)
+        assert tail.poll() > 0
+    assert tail.failed == {str(prefix / source.joinpath(broken).name)}
+    # the broken file is not fetched again, and a poll within the interval does nothing
+    assert tail.poll() == 0
+    assert tail.poll(min_interval=3600) == 0
+
+    snapshot = tail.snapshot
+    events_df = read_event_store(cache_dir)
+    assert (events_df['hostname'] == 'late.example').any()
+    n_broken = len(pd.read_csv(broken))
+    assert snapshot.n_events == len(events_df) == 3000 - n_broken
+    assert snapshot.n_files == len(paths) - 1
+    for chunk, _ in snapshot.chunks:
+        assert chunk['event_time'].dropna().is_monotonic_increasing
+
+    filtered_df, start_day, end_day = default_filter(events_df)
+    expected = aggregate_data(filtered_df, start_day, end_day, include_lists=False)
+    assert_profiles_equal(snapshot.profiles, expected)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from stingar_data import aggregate_data, build_event_index, filter_events
+from stingar_ips import parse_networks
+from stingar_rollup import aggregate_filtered, build_rollup, duration_bucket_range, extend_rollup
+from stingar_synthetic import synthetic_events
+
+from profiles import assert_profiles_equal
+
+@pytest.fixture(scope='module')
+def events():
+    df = synthetic_events(6000, days=5, seed=11)
+    # rows without an app or protocol are kept by the default selection
+    rng = np.random.default_rng(11)
+    df.loc[rng.random(len(df)) < 0.02, 'app'] = None
+    df.loc[rng.random(len(df)) < 0.02, 'protocol'] = None
+    return df, build_event_index(df), build_rollup(df)
+
+def selection(df, index, rollup, case):
+    # (start_day, end_day, apps, protocols, start_duration, end_duration, networks) of a sidebar state
+    start_day, end_day = int(index.days[0]), int(index.days[-1])
+    apps, protocols = list(index.bitmaps['app']), list(index.bitmaps['protocol'])
+    edges = rollup.duration_edges
+    start_duration, end_duration = edges[0], edges[-1]
+    networks = None
+    if case in ('days', 'combined'):
+        start_day, end_day = start_day + 1, end_day - 1
+    if case in ('apps', 'combined'):
+        apps = ['conpot']
+    if case == 'protocols':
+        protocols = ['ssh', 'telnet', None]
+    if case in ('durations', 'combined'):
+        start_duration, end_duration = edges[2], edges[-3]
+    if case == 'off_edges':
+        # bounds between edges fall back to the raw rows
+        start_duration, end_duration = (edges[1] + edges[2]) / 2, edges[-2]
+    if case in ('networks', 'combined'):
+        first_octet = df['src_ip'].mode()[0].split('.')[0]
+        networks = parse_networks(f"{first_octet}.0.0.0/8, 2001:db8::/32")
+    return start_day, end_day, apps, protocols, start_duration, end_duration, networks
+
+@pytest.mark.parametrize('case', ['full', 'days', 'apps', 'protocols', 'durations', 'off_edges', 'networks',
+                                  'combined'])
+def test_rollup_matches_aggregate_data(events, case):
+    df, index, rollup = events
+    start_day, end_day, apps, protocols, start_duration, end_duration, networks = selection(df, index, rollup, case)
+    filtered = filter_events(df, index, start_day, end_day, {'app': apps, 'protocol': protocols},
+                             start_duration, end_duration, networks)
+    # every case but off_edges is served from the cells
+    assert (duration_bucket_range(rollup.duration_edges, start_duration, end_duration) is None) == (case == 'off_edges')
+    expected = aggregate_data(filtered, start_day, end_day)
+    profiles = aggregate_filtered(rollup, filtered, start_day, end_day, apps, protocols, start_duration,
+                                  end_duration, networks=networks)
+    assert len(expected) > 0
+    assert_profiles_equal(profiles, expected)
+
+def test_extended_rollup_matches_aggregate_data(events):
+    df, index, _ = events
+    half = len(df) // 2
+    rollup = extend_rollup(build_rollup(df.iloc[:half]), df.iloc[half:])
+    start_day, end_day, apps, protocols, start_duration, end_duration, _ = selection(df, index, rollup, 'durations')
+    filtered = filter_events(df, index, start_day, end_day, {'app': apps, 'protocol': protocols},
+                             start_duration, end_duration)
+    profiles = aggregate_filtered(rollup, filtered, start_day, end_day, apps, protocols, start_duration, end_duration)
+    # IPs first seen in the second half take later codes, so the rows are in another order
+    assert_profiles_equal(profiles.sort_values('src_ip'), aggregate_data(filtered, start_day, end_day))
@@ -0,0 +1,39 @@
+import json
+
+import fsspec
+
+from stingar_data import list_event_files
+from stingar_store import MANIFEST_NAME, PARTITION_DIR, read_event_store, read_manifest, sync_event_store
+from stingar_synthetic import write_event_files
+
+def two_prefixes(tmp_path):
+    # the same hourly file names under two prefixes, with different events
+    write_event_files(tmp_path / 'a', 600, days=1, seed=1)
+    write_event_files(tmp_path / 'b', 900, days=1, seed=2)
+    fs = fsspec.filesystem('file')
+    return fs, list_event_files(fs, str(tmp_path / 'a')), list_event_files(fs, str(tmp_path / 'b'))
+
+def test_prefixes_share_a_store(tmp_path):
+    fs, paths_a, paths_b = two_prefixes(tmp_path)
+    cache_dir = tmp_path / 'cache'
+    assert sync_event_store(fs, paths_a, cache_dir) == len(paths_a)
+    assert sync_event_store(fs, paths_b, cache_dir) == len(paths_b)
+
+    manifest = read_manifest(cache_dir)
+    assert len(manifest) == len(set(manifest.values())) == len(paths_a) + len(paths_b)
+    assert len(list((cache_dir / PARTITION_DIR).glob('*.parquet'))) == len(manifest)
+    assert len(read_event_store(cache_dir, paths_a)) == 600
+    assert len(read_event_store(cache_dir, paths_b)) == 900
+
+def test_aliased_partitions_are_ingested_again(tmp_path):
+    fs, paths_a, paths_b = two_prefixes(tmp_path)
+    cache_dir = tmp_path / 'cache'
+    sync_event_store(fs, paths_a, cache_dir)
+    # a store from before partitions were named by full path: b's hours point at a's partitions
+    manifest = read_manifest(cache_dir)
+    manifest.update({path_b: manifest[path_a] for path_a, path_b in zip(paths_a, paths_b)})
+    (cache_dir / MANIFEST_NAME).write_text(json.dumps(manifest))
+
+    assert sync_event_store(fs, paths_a + paths_b, cache_dir) == len(paths_a) + len(paths_b)
+    assert len(read_event_store(cache_dir, paths_a)) == 600
+    assert len(read_event_store(cache_dir, paths_b)) == 900